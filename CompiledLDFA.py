@@ -0,0 +1,342 @@
+from collections import deque
+import itertools
+import numpy as np
+
+
+def object_array(items):
+    # filled one by one, so tuple elements (pairs lattices) are not broadcast as rows
+    array = np.empty(len(items), dtype=object)
+    for i, item in enumerate(items):
+        array[i] = item
+    return array
+
+
+class CompiledLDFA:
+    """
+    An array backed copy of an LDFA, built for running many words on it.
+    States are integer indices, lattice values are integer ranks (see Lattice.rank),
+    and the transitions are kept in dense next[state, letter] and weight[state, letter] tables.
+    Anything which is not compiled (printing, simplify, ...) is answered by the source LDFA.
+    """
+
+    MISSING = -1  # no transition with this letter, the run ends with the lattice minimum
+    NON_DETERMINISTIC = -2  # more than one transition with this letter, the run returns -1
+    INVALID_LETTER = -3  # a letter which is not in the alphabet, the run returns None
+
+    def __init__(self, ldfa):
+        self.ldfa = ldfa
+        self.alphabet = ldfa.alphabet
+        self.lattice = ldfa.lattice
+        lattice = self.lattice
+
+        self.values = list(lattice.lattice_set)
+        self.titles = list(ldfa.states.keys())
+        self.state_index = {q: i for i, q in enumerate(self.titles)}
+        self.letter_index = {sigma: i for i, sigma in enumerate(self.alphabet)}
+
+        n, m = len(self.titles), len(self.alphabet)
+        self.next = np.full((n, m), CompiledLDFA.MISSING, dtype=np.int64)
+        self.weight = np.zeros((n, m), dtype=np.int64)
+        self.final = np.zeros(n, dtype=np.int64)
+        for q, state in ldfa.states.items():
+            i = self.state_index[q]
+            self.final[i] = lattice.rank(state.value)
+            for sigma, transitions in state.transitions.items():
+                a = self.letter_index[sigma]
+                if len(transitions) > 1:
+                    self.next[i, a] = CompiledLDFA.NON_DETERMINISTIC
+                elif len(transitions) == 1:
+                    value, dest = transitions[0]
+                    self.next[i, a] = self.state_index[dest]
+                    self.weight[i, a] = lattice.rank(value)
+        self.meet = np.array(lattice.meet_table(), dtype=np.int64)
+
+        # the initial state is resolved once, and not on every run
+        initial = ldfa.initial_state()
+        self.initial = self.state_index[initial]
+        self.initial_value = lattice.rank(ldfa.q_0(initial))
+
+        # plain lists are faster than numpy arrays when indexed one cell at a time
+        self._next = self.next.tolist()
+        self._weight = self.weight.tolist()
+        self._final = self.final.tolist()
+        self._meet = self.meet.tolist()
+        self._titles = object_array(self.titles)
+        self._values = object_array(self.values)
+
+    def __getattr__(self, name):
+        if name == 'ldfa':
+            raise AttributeError(name)
+        return getattr(self.ldfa, name)
+
+    def compile(self):
+        return self
+
+    def run_word(self, word, for_state=False):
+        """
+        run a word on the automaton, exactly as LDFA.run_word does.
+        :param word: the word to run.
+        :param for_state: if True, the run will return the state on which it ended.
+        else, it will return the value of that word.
+        :return: the value of the word or the state on which it ended.
+        """
+        letter_index = self.letter_index
+        nexts, weights, meet = self._next, self._weight, self._meet
+        q, v = self.initial, self.initial_value
+        for letter in word:
+            a = letter_index.get(letter)
+            if a is None:
+                print("Input is invalid")
+                return
+            next_q = nexts[q][a]
+            if next_q < 0:
+                return -1 if next_q == CompiledLDFA.NON_DETERMINISTIC else self.lattice.get_min()
+            v = meet[v][weights[q][a]]
+            q = next_q
+        return self.titles[q] if for_state else self.values[meet[v][self._final[q]]]
+
+    def encode_words(self, words):
+        """
+        encode a ragged list of words as a padded integer array.
+        :param words: a list of words (strings or sequences of letters).
+        :return: (letters, lengths) whereas letters[i, p] is the index in the alphabet of the p-th letter
+        of the i-th word (-1 for letters which are not in the alphabet and for padding),
+        and lengths[i] is the length of the i-th word.
+        """
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        width = int(lengths.max()) if len(words) > 0 else 0
+        letters = np.full((len(words), width), -1, dtype=np.int64)
+        if width == 0:
+            return letters, lengths
+        try:
+            joined = ''.join(words) if all(isinstance(sigma, str) and len(sigma) == 1
+                                           for sigma in self.alphabet) else None
+        except TypeError:  # the words are sequences of letters and not strings
+            joined = None
+        if joined is not None:
+            # one character letters: translate the whole batch at once through the code points
+            codes = np.frombuffer(joined.encode('utf-32-le'), dtype=np.uint32)
+            alphabet_codes = np.array([ord(sigma) for sigma in self.alphabet], dtype=np.uint32)
+            order = np.argsort(alphabet_codes)
+            found = np.searchsorted(alphabet_codes[order], codes).clip(0, len(order) - 1)
+            flat = np.where(alphabet_codes[order][found] == codes, order[found], -1)
+        else:
+            flat = np.array([self.letter_index.get(sigma, -1) for w in words for sigma in w], dtype=np.int64)
+        rows = np.repeat(np.arange(len(words)), lengths)
+        starts = np.cumsum(lengths) - lengths
+        letters[rows, np.arange(len(flat)) - np.repeat(starts, lengths)] = flat
+        return letters, lengths
+
+    def run_encoded(self, letters, lengths):
+        """
+        run a batch of encoded words in lockstep: at each position, every word which is still running
+        advances its current state and meets its value with the transition weight.
+        :param letters: a padded integer array of letter indices (see encode_words).
+        :param lengths: the length of each word.
+        :return: (states, ranks, status) arrays, whereas status is 0 for a regular run,
+        MISSING if the run got stuck, NON_DETERMINISTIC if it reached a non deterministic transition,
+        and INVALID_LETTER if the word has a letter which is not in the alphabet.
+        ranks are the ranks of the values of the words (valid only for regular runs).
+        """
+        letters = np.asarray(letters, dtype=np.int64)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        count = len(lengths)
+        states = np.full(count, self.initial, dtype=np.int64)
+        values = np.full(count, self.initial_value, dtype=np.int64)
+        status = np.zeros(count, dtype=np.int64)
+        for p in range(letters.shape[1] if letters.ndim == 2 else 0):
+            running = np.nonzero((status == 0) & (lengths > p))[0]
+            if len(running) == 0:
+                break
+            a = letters[running, p]
+            bad_letter = a < 0
+            q = states[running]
+            next_q = self.next[q, a]
+            next_q[bad_letter] = CompiledLDFA.INVALID_LETTER
+            stuck = next_q < 0
+            status[running[stuck]] = next_q[stuck]
+            moving = running[~stuck]
+            q, a = q[~stuck], a[~stuck]
+            values[moving] = self.meet[values[moving], self.weight[q, a]]
+            states[moving] = next_q[~stuck]
+        ranks = self.meet[values, self.final[states]]
+        return states, ranks, status
+
+    def run_words(self, words, lengths=None, for_state=False):
+        """
+        run a batch of words on the automaton at once.
+        :param words: a ragged list of words, or a padded integer array of letter indices
+        (in which case lengths must be given as well).
+        :param lengths: the length of each word, if words is a padded integer array.
+        :param for_state: if True, return the states on which the runs ended instead of the values.
+        :return: a list with the result of run_word for each of the words.
+        """
+        if lengths is None:
+            letters, lengths = self.encode_words(words)
+        else:
+            letters = words
+        states, ranks, status = self.run_encoded(letters, lengths)
+        results = self._titles[states].tolist() if for_state else self._values[ranks].tolist()
+        if status.any():
+            for i in np.nonzero(status)[0].tolist():
+                if status[i] == CompiledLDFA.MISSING:
+                    results[i] = self.lattice.get_min()
+                elif status[i] == CompiledLDFA.NON_DETERMINISTIC:
+                    results[i] = -1
+                else:
+                    results[i] = None
+        return results
+
+    def step(self, q, v, sigma):
+        """
+        advance a configuration (state, rank of the value read so far) by one letter.
+        A run which has ended early (see run_word) is kept in a negative sink state,
+        whose code tells what the run returned.
+        """
+        if q < 0:
+            return q, v
+        a = self.letter_index.get(sigma)
+        if a is None:
+            return CompiledLDFA.INVALID_LETTER, v
+        next_q = self._next[q][a]
+        if next_q < 0:
+            return next_q, v
+        return next_q, self._meet[v][self._weight[q][a]]
+
+    def config_value(self, q, v):
+        """
+        :return: the value of a word whose run ended in the configuration (q, v).
+        """
+        if q == CompiledLDFA.MISSING:
+            return self.lattice.get_min()
+        if q == CompiledLDFA.NON_DETERMINISTIC:
+            return -1
+        if q == CompiledLDFA.INVALID_LETTER:
+            return None
+        return self.values[self._meet[v][self._final[q]]]
+
+    @classmethod
+    def equivalent(cls, c1, c2):
+        """
+        Search the product of c1 and c2 for a word on which they differ.
+        The configurations (q1, v1, q2, v2) are explored lazily in BFS order from the initial ones,
+        whereas v1, v2 are the values read so far, so only reachable configurations are built.
+        :param c1: a CompiledLDFA.
+        :param c2: a CompiledLDFA.
+        :return: a shortest distinguishing word if c1 and c2 aren't equivalent, or None if they are.
+        """
+        start = (c1.initial, c1.initial_value, c2.initial, c2.initial_value)
+        if c1.config_value(start[0], start[1]) != c2.config_value(start[2], start[3]):
+            return ""
+        parents = {start: None}
+        to_visit = deque([start])
+        while to_visit:
+            config = to_visit.popleft()
+            q1, v1, q2, v2 = config
+            for sigma in c1.alphabet:
+                p1, u1 = c1.step(q1, v1, sigma)
+                p2, u2 = c2.step(q2, v2, sigma)
+                next_config = (p1, u1, p2, u2)
+                if next_config in parents:
+                    continue
+                parents[next_config] = (config, sigma)
+                if c1.config_value(p1, u1) != c2.config_value(p2, u2):
+                    word = []
+                    while parents[next_config] is not None:
+                        next_config, sigma = parents[next_config]
+                        word.append(sigma)
+                    return ''.join(reversed(word))
+                to_visit.append(next_config)
+        return None
+
+    def extend_frontier(self, states, values, letter_codes):
+        """
+        extend every node of a frontier of the word tree by every letter, with one transition each.
+        :param states: the states (or negative sink codes) the words of the frontier end in.
+        :param values: the ranks of the values read so far by those words.
+        :param letter_codes: the index in the alphabet of each letter to extend by (-1 if it is not there).
+        :return: the (states, values) frontier of the extended words, ordered as itertools.product orders them.
+        """
+        m = len(letter_codes)
+        q = np.repeat(states, m)
+        v = np.repeat(values, m)
+        a = np.tile(letter_codes, len(states))
+        next_q = q.copy()
+        live = q >= 0
+        next_q[live & (a < 0)] = CompiledLDFA.INVALID_LETTER
+        live &= a >= 0
+        next_q[live] = self.next[q[live], a[live]]
+        moved = live & (next_q >= 0)
+        v[moved] = self.meet[v[moved], self.weight[q[moved], a[moved]]]
+        return next_q, v
+
+    def frontier_values(self, states, values):
+        """
+        :return: the values (lattice elements, as run_word returns them) of the words of a frontier.
+        """
+        results = np.empty(len(states), dtype=object)
+        live = states >= 0
+        results[live] = self._values[self.meet[values[live], self.final[states[live]]]]
+        for q in (CompiledLDFA.MISSING, CompiledLDFA.NON_DETERMINISTIC, CompiledLDFA.INVALID_LETTER):
+            sink = np.nonzero(states == q)[0]
+            if len(sink) > 0:
+                results[sink] = [self.config_value(q, 0)] * len(sink)
+        return results.tolist()
+
+    def exhaustive_equivalent(self, vq, max_length=11, max_words=None, vq_batch=None, memo=None,
+                              alphabet=None, chunk_size=1024):
+        """
+        Compare a membership function with this automaton on all the words up to some length,
+        by increasing length and in lexicographic order within every length.
+        The word tree is walked level by level: each level is kept as frontier arrays of the state and
+        value of its words, so every extension costs one transition and no word is run from the start.
+        The words themselves are only generated, chunk by chunk, when they are asked from vq.
+        :param vq: the membership function (word)->value.
+        :param max_length: the length of the longest words to check.
+        :param max_words: if not None, stop after checking this many words.
+        :param vq_batch: if not None, a function (words)->values used instead of vq, one chunk at a time.
+        :param memo: if not None, a dictionary {word: value} of known answers of vq, which is also updated.
+        :param alphabet: the letters to build words from (the automaton's alphabet by default).
+        :param chunk_size: the number of words asked at once from vq_batch.
+        :return: (word, checked) whereas word is the first word on which vq and the automaton differ
+        (or None if there is no such word), and checked is the number of words that were compared.
+        """
+        alphabet = self.alphabet if alphabet is None else alphabet
+        letter_codes = np.array([self.letter_index.get(sigma, -1) for sigma in alphabet], dtype=np.int64)
+        memo = {} if memo is None else memo
+        states = np.array([self.initial], dtype=np.int64)
+        values = np.array([self.initial_value], dtype=np.int64)
+        checked = 0
+        for length in range(max_length + 1):
+            if length > 0:
+                if max_words is not None:
+                    # only the first words of the next level will be checked
+                    needed = -(-(max_words - checked) // len(alphabet))
+                    states, values = states[:needed], values[:needed]
+                states, values = self.extend_frontier(states, values, letter_codes)
+            level = itertools.product(alphabet, repeat=length)
+            for start in range(0, len(states), chunk_size):
+                end = min(start + chunk_size, len(states))
+                if max_words is not None:
+                    end = min(end, start + max_words - checked)
+                words = [''.join(w) for w in itertools.islice(level, end - start)]
+                expected = self.frontier_values(states[start:end], values[start:end])
+                if vq_batch is not None:
+                    missing = [w for w in words if w not in memo]
+                    if missing:
+                        memo.update(zip(missing, vq_batch(missing)))
+                for word, value in zip(words, expected):
+                    checked += 1
+                    if word not in memo:
+                        memo[word] = vq(word)
+                    if memo[word] != value:
+                        return word, checked
+                if max_words is not None and checked >= max_words:
+                    return None, checked
+        return None, checked
+
+    def initial_state(self):
+        return self.titles[self.initial]
+
+    def num_of_states(self):
+        return len(self.titles)
@@ -0,0 +1,134 @@
+class CounterExampleProcessor:
+    """
+    Processing of counterexamples, before they are added to a table.
+    shorten cuts loops and letters out of a counterexample, and replaces letters so that loops can be cut,
+    within a budget of membership queries.
+    distinguishing_suffix is a Rivest-Schapire style search: instead of adding every suffix of
+    a counterexample as a column, one suffix which separates two rows that the hypothesis merged
+    is found by a binary search over the decomposition of the counterexample along the run of
+    the hypothesis, with O(log |w|) membership queries.
+    """
+
+    def __init__(self, oracle):
+        self.oracle = oracle
+        self.queries = 0  # the membership queries asked by the processing (the known values are not counted)
+
+    def access_word(self, state):
+        # the tables name every state after its representative row, with 'e' for the empty word
+        return '' if state == 'e' else state
+
+    def alpha(self, hypothesis, word, i, known):
+        """
+        :return: the value of access(q) + word[i:], whereas q is the state of the hypothesis after word[:i].
+        """
+        state = hypothesis.run_word(word[:i], for_state=True)
+        if state not in hypothesis.state_index:
+            return None
+        query = self.access_word(state) + word[i:]
+        if query in known:
+            return known[query]
+        self.queries += 1
+        return self.oracle.vq(query)
+
+    def distinguishing_suffix(self, hypothesis, word, known=None):
+        """
+        :param hypothesis: the automaton the counterexample was found for.
+        :param word: the counterexample.
+        :param known: an optional {word: value} map of values which need not be queried (the table's T).
+        :return: a suffix of word which separates the rows of two states, or None if the decomposition
+        does not expose one (alpha(0) == alpha(|word|), which happens when the hypothesis is wrong only
+        in its transition values).
+        """
+        hypothesis = hypothesis.compile()
+        known = known if known is not None else {}
+        low, high = 0, len(word)
+        low_value = self.alpha(hypothesis, word, low, known)
+        high_value = self.alpha(hypothesis, word, high, known)
+        if low_value is None or high_value is None or low_value == high_value:
+            return None
+        # invariant: alpha(low) != alpha(high)
+        while high - low > 1:
+            mid = (low + high) // 2
+            mid_value = self.alpha(hypothesis, word, mid, known)
+            if mid_value == low_value:
+                low = mid
+            else:
+                high = mid
+        return word[high:]
+
+    def states_along(self, hypothesis, word):
+        """
+        :return: the indices of the states of the hypothesis after each prefix of the word (|word| + 1 of them).
+        """
+        q = hypothesis.initial
+        states = [q]
+        for letter in word:
+            # a missing transition ends the run (the rest of the states are marked as missing too)
+            q = hypothesis._next[q][hypothesis.letter_index[letter]] if q >= 0 else q
+            states.append(q)
+        return states
+
+    def loops(self, hypothesis, word):
+        """
+        :return: the loops (i, j) of the run of the word on the hypothesis, whereas the states after word[:i]
+        and after word[:j] are the same, the longest loops first.
+        """
+        states = self.states_along(hypothesis, word)
+        last = {}
+        loops = []
+        for j, q in enumerate(states):
+            if q in last:
+                loops.append((last[q], j))
+            elif q >= 0:
+                last[q] = j
+        return sorted(loops, key=lambda loop: loop[0] - loop[1])
+
+    def candidates(self, hypothesis, word):
+        """
+        the shorter words to try instead of the word: first the loops of its run on the hypothesis
+        are cut (the longest loops first), then single letters are removed, and last a letter is replaced
+        whenever the run of the new word has a loop, which is cut (so every candidate is shorter).
+        """
+        for i, j in self.loops(hypothesis, word):
+            yield word[:i] + word[j:]
+        for i in range(len(word)):
+            yield word[:i] + word[i + 1:]
+        for i in range(len(word)):
+            for letter in hypothesis.alphabet:
+                if letter != word[i]:
+                    replaced = word[:i] + letter + word[i + 1:]
+                    for start, end in self.loops(hypothesis, replaced)[:1]:
+                        yield replaced[:start] + replaced[end:]
+
+    def shorten(self, hypothesis, word, budget, known=None):
+        """
+        make a counterexample shorter, as long as it stays a counterexample (its value in the target
+        differs from its value in the hypothesis). Every candidate word costs one membership query.
+        :param hypothesis: the automaton the counterexample was found for.
+        :param word: the counterexample.
+        :param budget: the maximal number of membership queries to spend.
+        :param known: an optional {word: value} map of values which need not be queried (the table's T).
+        :return: the shortest counterexample found.
+        """
+        hypothesis = hypothesis.compile()
+        known = known if known is not None else {}
+        values = {}
+        spent = 0
+        changed = True
+        while changed:
+            changed = False
+            for candidate in self.candidates(hypothesis, word):
+                if candidate in known:
+                    value = known[candidate]
+                elif candidate in values:
+                    value = values[candidate]
+                elif spent < budget:
+                    spent += 1
+                    self.queries += 1
+                    value = values[candidate] = self.oracle.vq(candidate)
+                else:
+                    return word
+                if value != hypothesis.run_word(candidate):
+                    word, changed = candidate, True
+                    break
+        return word
@@ -0,0 +1,325 @@
+import LDFA
+
+
+class DiscriminationNode:
+    """
+    A node of a discrimination tree. Inner nodes hold a suffix and a child for every branch, leaves hold
+    the access word of a state. A branch is keyed by the rank of the value that the word it was made for
+    had with the suffix, and keeps that word, whose potential decides which words may take the branch
+    (see DiscriminationTree.compatible).
+    """
+
+    def __init__(self, suffix=None, access=None):
+        self.suffix = suffix
+        self.children = {}
+        self.words = {}  # {rank: the word the branch was made for}
+        self.access = access
+
+    def is_leaf(self):
+        return self.suffix is None
+
+
+class DiscriminationTree:
+    """
+    A Kearns-Vazirani style learner adapted to lattice values, with the same close / create_automaton /
+    add_counter_example interface as the observation tables.
+    The states are the leaves of the tree, and a word is classified by sifting it from the root:
+    at every inner node the value of the word concatenated with the node's suffix is queried, and the word
+    takes the branch of that value, or else a branch it is compatible with (see compatible), searched depth first.
+    A word that reaches no leaf becomes a new state. The access words of the states always stay at their leaves.
+    Every sifted word has a potential, the join of the values of its known extensions, which is below
+    the value of its path (as the row potential of the FOL* table). Two words that reach a state of the
+    target by paths of different values only differ above their potentials, so they are compatible, and the
+    hypothesis keeps about one state for every state of the target (and not one for every value of a path).
+    The transitions of access(q) + sigma get its potential, and the states the value of their access word.
+    Only the cells on the sifting paths, on the decompositions of the counterexamples and of the access words
+    with the suffixes of the counterexamples are queried, they are kept in T.
+    """
+
+    def __init__(self, lattice, alphabet, oracle):
+        self.lattice = lattice
+        self.alphabet = alphabet
+        self.oracle = oracle
+        self.T = {}
+        # {word: potential} of the sifted words, the path of the empty word has the lattice's maximum
+        self.potentials = {'': lattice.get_max()}
+        self.root = DiscriminationNode(suffix='')
+        self.leaves = {}  # {access word: leaf}
+        self.states = []  # the access words of the states reachable from the empty word
+        self.transitions = {}  # {(access word, sigma): access word}
+        self.weights = {}  # {(access word, sigma): the value of the transition in the hypothesis}
+        # the suffixes of the counterexamples, and those that raised a transition value. The access words are
+        # queried with them (as the rows of S with E in FOL*), which raises the potentials of the states and
+        # puts in T the words that check_consistency uses as counterexamples without an EQ
+        self.suffixes = []
+        self.hypothesis = None
+        self.sift([''])
+
+    def query(self, words):
+        """
+        ask the oracle, in one batch, for the values of the words which are not in T yet.
+        """
+        missing = list(dict.fromkeys(word for word in words if word not in self.T))
+        if missing:
+            for word, value in zip(missing, self.oracle.vq_batch(missing)):
+                self.record(word, value)
+
+    def vq(self, word):
+        if word not in self.T:
+            self.record(word, self.oracle.vq(word))
+        return self.T[word]
+
+    def record(self, word, value):
+        """
+        keep the value of the word, and raise the potentials of its sifted prefixes to it.
+        """
+        self.T[word] = value
+        potentials = self.potentials
+        for i in range(len(word) + 1):
+            prefix = word[:i]
+            if prefix in potentials:
+                potentials[prefix] = self.lattice.join(potentials[prefix], value)
+
+    def track(self, word):
+        """
+        start keeping the potential of the word, from the values of its extensions that are already in T.
+        """
+        if word not in self.potentials:
+            potential = self.lattice.get_min()
+            for other, value in self.T.items():
+                if other.startswith(word):
+                    potential = self.lattice.join(potential, value)
+            self.potentials[word] = potential
+
+    def compatible(self, value, potential, other_value, other_potential):
+        """
+        :return: True if the values of two words with a suffix are equal below the meet of their potentials,
+        above which one of them has no extension that reaches the threshold (as a zero line of FOL*).
+        """
+        cap = self.lattice.meet(potential, other_potential)
+        return self.lattice.meet(value, cap) == self.lattice.meet(other_value, cap)
+
+    def branches(self, node, value, potential):
+        """
+        :return: the ranks of the branches of the node that a word with the value and the potential may take:
+        the branch of its value first, then the other compatible branches from the greatest potential down.
+        """
+        rank = self.lattice.rank(value)
+        ranks = [other for other, word in node.words.items() if other != rank and
+                 self.compatible(value, potential, self.lattice.lattice_set[other], self.potentials[word])]
+        ranks.sort(key=lambda other: self.lattice.rank(self.potentials[node.words[other]]), reverse=True)
+        return [rank] + ranks if rank in node.children else ranks
+
+    def sift(self, words):
+        """
+        sift the words down the tree together, the queries of every level are asked in one batch.
+        A word may be compatible with several branches of a node, so the branches are searched depth first,
+        and a word reaches the first leaf all of whose discriminators it is compatible with.
+        A word which reaches none becomes the access word of a new leaf, at the first node it had no branch to take.
+        :return: the leaf of every word.
+        """
+        leaves = [None] * len(words)
+        stacks, dead = {}, {}
+        for i, word in enumerate(words):
+            if word in self.leaves:
+                leaves[i] = self.leaves[word]
+            else:
+                self.track(word)
+                stacks[i] = [self.root]
+        while stacks:
+            queries = []
+            for i in list(stacks):
+                word, stack = words[i], stacks[i]
+                while True:
+                    if not stack:
+                        node, value = dead[i]
+                        if self.branches(node, value, self.potentials[word]):
+                            # a word of this batch made a leaf for the branch meanwhile
+                            stack.append(node)
+                            continue
+                        rank = self.lattice.rank(value)
+                        node.children[rank] = leaves[i] = self.leaves[word] = DiscriminationNode(access=word)
+                        node.words[rank] = word
+                        break
+                    node = stack[-1]
+                    if node.is_leaf():
+                        leaves[i] = node
+                        break
+                    if word + node.suffix not in self.T:
+                        queries.append(word + node.suffix)
+                        break
+                    stack.pop()
+                    value = self.T[word + node.suffix]
+                    ranks = self.branches(node, value, self.potentials[word])
+                    if not ranks:
+                        dead.setdefault(i, (node, value))
+                    stack.extend(node.children[rank] for rank in reversed(ranks))
+                if leaves[i] is not None:
+                    del stacks[i]
+            self.query(queries)
+        return leaves
+
+    def close(self):
+        """
+        sift the successors of the states, from the empty word on, until they all lead to known states.
+        """
+        self.states = ['']
+        self.transitions = {}
+        seen = {''}
+        frontier = ['']
+        while frontier:
+            pairs = [(u, sigma) for u in frontier for sigma in self.alphabet]
+            leaves = self.sift([u + sigma for u, sigma in pairs])
+            frontier = []
+            for pair, leaf in zip(pairs, leaves):
+                self.transitions[pair] = leaf.access
+                if leaf.access not in seen:
+                    seen.add(leaf.access)
+                    self.states.append(leaf.access)
+                    frontier.append(leaf.access)
+        self.query([u + suffix for u in self.states for suffix in self.suffixes])
+
+    def state_name(self, s):
+        return s if s != '' else 'e'
+
+    def create_automaton(self):
+        q_0 = lambda q: self.lattice.get_max() if q == 'e' else self.lattice.get_min()
+        f = lambda q: self.T[q if q != 'e' else '']
+
+        automaton = LDFA.LDFA(self.alphabet, self.lattice, q_0, f)
+        self.weights = {}
+        for state in self.states:
+            automaton.add_state(self.state_name(state), self.T[state])
+            for sigma in self.alphabet:
+                weight = self.weights[state, sigma] = self.potentials[state + sigma]
+                automaton.add_transition(self.state_name(state), sigma,
+                                         self.state_name(self.transitions[state, sigma]), weight)
+        self.hypothesis = automaton
+        return automaton
+
+    def run(self, word):
+        """
+        :return: the access words of the states of the hypothesis after every prefix of the word,
+        and the meets of the transition values along every prefix.
+        """
+        states, paths = [''], [self.lattice.get_max()]
+        for sigma in word:
+            paths.append(self.lattice.meet(paths[-1], self.weights[states[-1], sigma]))
+            states.append(self.transitions[states[-1], sigma])
+        return states, paths
+
+    def split(self, counter_example):
+        """
+        refine the tree with a counterexample of the last hypothesis, found by a Rivest-Schapire style
+        binary search over beta(i), the meet of the first i transition values of the word in the hypothesis
+        with the value of access(q_i) + word[i:]. beta(0) is the value of the word and beta(|word|) is its
+        value in the hypothesis, so there is an i with beta(i - 1) != beta(i). Let u = access(q_(i-1)) + word[i - 1],
+        which was sifted to the leaf of a = access(q_i), and x = word[i:]:
+        if u and a are not compatible with x, the leaf of a becomes an inner node with the suffix x (and u is
+        sifted again by close, to another state or to a new one). If their potentials are not comparable
+        (which only happens in a lattice that is not a full order) u gets a leaf of that node too.
+        Otherwise if u has a greater potential it becomes the access word of the leaf, otherwise the value
+        of u + x raised the potential of u, which is the value of the transition, and x is added to the suffixes.
+        :return: False if the word is not a counterexample of the last hypothesis, or nothing changed.
+        """
+        meet = self.lattice.meet
+        value = self.vq(counter_example)
+        states, paths = self.run(counter_example)
+        if meet(paths[-1], self.T[states[-1]]) == value:
+            return False
+        low, high = 0, len(counter_example)
+        # invariant: beta(low) is the value of the word, and beta(high) is not
+        while high - low > 1:
+            mid = (low + high) // 2
+            if meet(paths[mid], self.vq(states[mid] + counter_example[mid:])) == value:
+                low = mid
+            else:
+                high = mid
+        sigma, suffix = counter_example[low], counter_example[high:]
+        u, a = states[low] + sigma, states[high]
+        u_value, a_value = self.vq(u + suffix), self.vq(a + suffix)
+        u_potential, a_potential = self.potentials[u], self.potentials[a]
+        compatible = self.compatible(u_value, u_potential, a_value, a_potential)
+        if not compatible or not (self.lattice.order(u_potential, a_potential) or
+                                  self.lattice.order(a_potential, u_potential)):
+            node = self.leaves[a]
+            node.suffix, node.access = suffix, None
+            # a word compatible with a has a chance to take its branch (and u is sifted again by close), but
+            # when the potentials are not comparable neither word can stand for the other, and u gets a leaf
+            for word, word_value in [(a, a_value), (u, u_value)] if compatible else [(a, a_value)]:
+                rank = self.lattice.rank(word_value)
+                node.children[rank] = self.leaves[word] = DiscriminationNode(access=word)
+                node.words[rank] = word
+            return True
+        if u_potential != a_potential and self.lattice.order(a_potential, u_potential):
+            leaf = self.leaves.pop(a)
+            leaf.access = u
+            self.leaves[u] = leaf
+            return True
+        if self.potentials[u] == self.weights[states[low], sigma]:
+            return False
+        if suffix not in self.suffixes:
+            self.suffixes.append(suffix)
+        return True
+
+    def check_consistency(self, automaton, skip=()):
+        """
+        :return: the first word of T, not in skip, whose value in the automaton is different, or None.
+        """
+        words = [w for w in self.T if w not in skip]
+        for w, value in zip(words, automaton.run_words(words)):
+            if self.T[w] != value:
+                return w
+
+    def add_counter_example(self, counter_example):
+        """
+        refine the tree with the counterexample, for as long as it is still a counterexample of
+        the hypothesis and the refinement changes it. Then every word of T whose value the hypothesis
+        gets wrong is used as a counterexample too, which needs no equivalence query, until none of them
+        changes the hypothesis.
+        """
+        for i in range(len(counter_example) + 1):
+            if counter_example[i:] not in self.suffixes:
+                self.suffixes.append(counter_example[i:])
+        stuck = set()
+        while counter_example is not None and self.hypothesis is not None:
+            changed = False
+            while self.split(counter_example):
+                changed = True
+                self.close()
+                self.create_automaton()
+            if changed:
+                stuck.clear()
+            else:
+                stuck.add(counter_example)
+            counter_example = self.check_consistency(self.hypothesis.compile(), stuck)
+
+    def dimensions(self):
+        """
+        :return: (the number of leaves, the number of inner nodes), the states and the suffixes of the tree.
+        """
+        inner = 0
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            if not node.is_leaf():
+                inner += 1
+                nodes.extend(node.children.values())
+        return len(self.leaves), inner
+
+    def print_table(self, file=None):
+        lines = []
+
+        def walk(node, depth, branch):
+            if node.is_leaf():
+                lines.append("{}{} -> {}".format("  " * depth, branch, self.state_name(node.access)))
+            else:
+                lines.append("{}{} [{}]".format("  " * depth, branch, node.suffix if node.suffix != '' else 'e'))
+                for rank, child in node.children.items():
+                    walk(child, depth + 1, self.lattice.lattice_set[rank])
+
+        walk(self.root, 0, '')
+        if file is None:
+            print("\n".join(lines))
+        else:
+            file.write("\n".join(lines) + "\n")
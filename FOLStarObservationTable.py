@@ -1,82 +1,360 @@
 from LatticeMinimization import find_minimal_partition
 import LDFA
+import Metrics
+import WordStore
+import numpy as np
 from termcolor import colored
 
 
+def packed_signatures(view):
+    """
+    :param view: a boolean matrix.
+    :return: the rows of the matrix as integers (bit j of a row's integer is its j-th cell).
+    """
+    packed = np.packbits(view, axis=1, bitorder='little')
+    return [int.from_bytes(row.tobytes(), 'little') for row in packed]
+
+
+class ThresholdPartition:
+    """
+    The classes of the rows of the table (by row id) for a group of lattice ranks
+    that threshold the table the same way, maintained as rows and columns are added.
+    Every row has a signature, which is the bits order(l, T[s + e]) of its cells packed in one integer,
+    and classes maps each signature to the (sorted) list of the rows that have it.
+    Adding a row puts it in its class, and adding a column only splits existing classes.
+    """
+
+    def __init__(self, ranks, above):
+        self.ranks = ranks
+        self.above = above  # the order row of ranks[0], which the other ranks agree with on the values seen
+        self.signatures = []
+        self.classes = {}
+
+    def split(self, rank, above):
+        """
+        split the group by a rank which was not seen in the table before, so the classes fit both parts.
+        :param above: the order matrix of the lattice ranks (see FOLStarObservationTable.above).
+        :return: a new ThresholdPartition for the ranks of the group that differ from ranks[0] on rank,
+        or None if the group does not split.
+        """
+        keep = [i for i in self.ranks if above[i][rank] == above[self.ranks[0]][rank]]
+        rest = [i for i in self.ranks if above[i][rank] != above[self.ranks[0]][rank]]
+        if not rest:
+            return None
+        self.ranks = keep
+        other = ThresholdPartition(rest, above[rest[0]])
+        other.signatures = list(self.signatures)
+        other.classes = {signature: list(rows) for signature, rows in self.classes.items()}
+        return other
+
+    def add_rows(self, block):
+        """
+        :param block: the value ranks of the new rows (a matrix with a row for each of them).
+        """
+        for signature in packed_signatures(self.above[block]):
+            self.classes.setdefault(signature, []).append(len(self.signatures))
+            self.signatures.append(signature)
+
+    def add_cols(self, block, first):
+        """
+        :param block: the value ranks of the new columns (a matrix with a column for each of them).
+        :param first: the column id of the first of the new columns.
+        """
+        extra = self.above[block]
+        if not extra.any():
+            return
+        extra = packed_signatures(extra)
+        classes = {}
+        for signature, rows in self.classes.items():
+            for r in rows:
+                new_signature = signature | (extra[r] << first)
+                self.signatures[r] = new_signature
+                classes.setdefault(new_signature, []).append(r)
+        self.classes = classes
+
+    def partition(self, S):
+        """
+        :return: the partition of the non zero rows, ordered by the first appearance of each class in S.
+        """
+        classes = sorted((rows for signature, rows in self.classes.items() if signature), key=lambda rows: rows[0])
+        return [set(S[r] for r in rows) for rows in classes]
+
+
 class FOLStarObservationTable:
 
     # oracle holds 2 functions:
     # vq is a function (word)->value
+    # The values of the table are kept as lattice ranks (see Lattice.rank) in one growable integer matrix,
+    # indexed by (row id, column id), whereas the row ids follow S and the column ids follow E.
+    # T keeps the value of every word that was queried, in a WordStore whose cells are addressed by
+    # (prefix id, suffix id), so a cell s + e is found with no string concatenation.
     def __init__(self, lattice, alphabet, oracle):
         self.alphabet = alphabet
         self.oracle = oracle
         self.lattice = lattice
         self.states = ['']
-        self.S = ['']
-        self.E = ['']
-        self.T = {'': oracle.vq("")}
-        self.TL = {l: {s + e: 1 if self.lattice.order(l, self.T[s + e]) else 0
-                       for s in self.S for e in self.E} for l in self.lattice.lattice_set}
+        self.S = []
+        self.E = []
+        self.row_id = {}
+        self.col_id = {}
+        self.row_nodes = []  # the prefix id of every row of S (in the WordStore)
+        self.col_nodes = []  # the suffix id of every column of E
+        self.matrix = np.zeros((16, 4), dtype=np.int32)
+        # above[i][r] is True iff the i-th element of the lattice is <= the element of rank r
+        self.above = np.array([[self.lattice.order(l, v) for v in self.lattice.lattice_set]
+                               for l in self.lattice.lattice_set], dtype=bool)
+        self.observed = np.zeros(len(self.lattice.lattice_set), dtype=bool)  # the ranks seen in the table
+        # the classes of the rows for every group of ranks that threshold the table the same way
+        self.partitions = [ThresholdPartition(list(range(len(self.lattice.lattice_set))), self.above[0])]
+        self.potentials = {}  # {s: (max_e(s), row_potential(s))} for the rows of S
+        self.version = 0  # changes whenever the table does, see cached
+        self.cache = {}
+        self.metrics = None  # if set (see LearningAlgorithm), the partitions are timed as a phase of their own
+        self.T = WordStore.WordStore()
+        self.T[''] = oracle.vq("")
+        self.add_row('')
+        self.add_col('')
         self.add_col("a")
         self.add_col("b")
 
-    def add_col(self, e):
-        if e not in self.E:
+    def query(self, cells):
+        """
+        ask the oracle, in a single batch, for the values of the cells (prefix id, suffix id) which are not in T yet.
+        only the words of the missing cells are built.
+        """
+        missing = list(dict.fromkeys(self.T.canonical(p, c) for p, c in cells if not self.T.has_cell(p, c)))
+        if missing:
+            for (p, c), value in zip(missing, self.oracle.vq_batch([self.T.word(p, c) for p, c in missing])):
+                self.T.set_cell(p, c, value)
+
+    def value(self, s, e):
+        return self.T.get_cell(self.row_nodes[self.row_id[s]], self.col_nodes[self.col_id[e]])
+
+    def values(self):
+        """
+        :return: the |S| x |E| matrix of the ranks of the values in the table (a view, not a copy).
+        """
+        return self.matrix[:len(self.S), :len(self.E)]
+
+    def threshold_view(self, l):
+        """
+        :return: a boolean |S| x |E| matrix, whose (s, e) cell is order(l, T[s + e]).
+        """
+        return self.above[self.lattice.rank(l)][self.values()]
+
+    def grow(self, rows, cols):
+        if rows > self.matrix.shape[0] or cols > self.matrix.shape[1]:
+            matrix = np.zeros((max(rows, 2 * self.matrix.shape[0]), max(cols, 2 * self.matrix.shape[1])),
+                              dtype=np.int32)
+            matrix[:self.matrix.shape[0], :self.matrix.shape[1]] = self.matrix
+            self.matrix = matrix
+
+    def ranks(self, rows, cols):
+        """
+        :param rows: prefix ids.
+        :param cols: suffix ids.
+        :return: the matrix of the ranks of the values of their cells.
+        """
+        get_cell = self.T.get_cell
+        values = [get_cell(p, c) for p in rows for c in cols]
+        return self.lattice.rank_array(values).reshape(len(rows), len(cols))
+
+    def add_cols(self, cols):
+        """
+        add some columns to the table, all of their cells are queried in one batch.
+        :return: True if any of the columns is new.
+        """
+        cols = [e for e in dict.fromkeys(cols) if e not in self.col_id]
+        if not cols:
+            return False
+        nodes = [self.T.suffix(e) for e in cols]
+        self.query([(p, c) for c in nodes for p in self.row_nodes])
+        m = len(self.E)
+        self.grow(len(self.S), m + len(cols))
+        block = self.ranks(self.row_nodes, nodes)
+        self.matrix[:len(self.S), m:m + len(cols)] = block
+        self.observe(block)
+        for partition in self.partitions:
+            partition.add_cols(block, m)
+        for e, c in zip(cols, nodes):
+            self.col_id[e] = len(self.E)
             self.E.append(e)
-            for s in self.S:
-                self.T[s + e] = self.oracle.vq(s + e)
-                for l in self.lattice.lattice_set:
-                    self.TL[l][s + e] = 1 if self.lattice.order(l, self.T[s + e]) else 0
-            return True
-        return False
+            self.col_nodes.append(c)
+        self.update_potentials(self.S, cols)
+        self.version += 1
+        return True
 
-    def add_row(self, s):
-        if s not in self.S:
+    def add_rows(self, rows):
+        """
+        add some rows to the table, all of their cells are queried in one batch.
+        :return: True if any of the rows is new.
+        """
+        rows = [s for s in dict.fromkeys(rows) if s not in self.row_id]
+        if not rows:
+            return False
+        nodes = [self.T.prefix(s) for s in rows]
+        self.query([(p, c) for p in nodes for c in self.col_nodes])
+        n = len(self.S)
+        self.grow(n + len(rows), len(self.E))
+        block = self.ranks(nodes, self.col_nodes)
+        self.matrix[n:n + len(rows), :len(self.E)] = block
+        self.observe(block)
+        for partition in self.partitions:
+            partition.add_rows(block)
+        for s, p in zip(rows, nodes):
+            self.row_id[s] = len(self.S)
             self.S.append(s)
-            for e in self.E:
-                self.T[s + e] = self.oracle.vq(s + e)
-                for l in self.lattice.lattice_set:
-                    self.TL[l][s + e] = 1 if self.lattice.order(l, self.T[s + e]) else 0
-            return True
-        return False
+            self.row_nodes.append(p)
+            self.potentials[s] = '', self.T.get_cell(p, WordStore.WordStore.ROOT)
+        self.update_potentials(rows, self.E)
+        self.version += 1
+        return True
+
+    def observe(self, block):
+        """
+        mark the values of new cells as observed, splitting the groups of ranks that
+        threshold the table the same way by every value that was not observed before.
+        """
+        for rank in np.unique(block).tolist():
+            if not self.observed[rank]:
+                self.observed[rank] = True
+                for partition in list(self.partitions):
+                    other = partition.split(rank, self.above)
+                    if other is not None:
+                        self.partitions.append(other)
+
+    def cached(self, name, compute):
+        """
+        :return: compute(), which is only computed again once the table changes.
+        """
+        version, value = self.cache.get(name, (None, None))
+        if version != self.version:
+            value = compute()
+            self.cache[name] = (self.version, value)
+        return value
+
+    def add_col(self, e):
+        return self.add_cols([e])
+
+    def add_row(self, s):
+        return self.add_rows([s])
 
     def add_counter_example(self, counter_example):
-        added = False
-        for i in range(len(counter_example)):
-            if self.add_col(counter_example[i:]):
-                added = True
-        return added
+        return self.add_cols([counter_example[i:] for i in range(len(counter_example))])
+
+    def redundant_columns(self):
+        """
+        find columns that can be dropped together, without changing the partition of any lattice element
+        (no two classes merge and no row becomes a zero row) and without changing the max_e of any row.
+        The newest columns are tried first, and the empty suffix is always kept.
+        :return: the list of the redundant columns.
+        """
+        # a column that ever becomes the maximum while max_e scans a row is kept, so no scan changes
+        max_es = set()
+        for s in self.S:
+            cur_max = self.value(s, '')
+            for e in self.E:
+                if cur_max < self.value(s, e):
+                    cur_max = self.value(s, e)
+                    max_es.add(e)
+        classes = [set(partition.classes) for partition in self.partitions]
+        removed = []
+        for e in reversed(self.E):
+            if e == '' or e in max_es:
+                continue
+            bit = 1 << self.col_id[e]
+            reduced_classes = []
+            for signatures in classes:
+                reduced = set(signature & ~bit for signature in signatures)
+                if len(reduced) < len(signatures) or (0 in reduced and 0 not in signatures):
+                    break
+                reduced_classes.append(reduced)
+            else:
+                classes = reduced_classes
+                removed.append(e)
+        return removed
+
+    def compact(self):
+        """
+        drop the redundant columns (see redundant_columns) from E. Their values stay in T,
+        so adding one of them again only queries the rows that were added since.
+        This trades the size of E for queries: a column which separates no rows of S now may separate
+        rows that are added later, so the hypotheses can be coarser, and the column comes back through
+        a counterexample (more EQs, and the columns of its suffixes).
+        :return: the list of the dropped columns.
+        """
+        removed = self.redundant_columns()
+        if not removed:
+            return removed
+        removed_set = set(removed)
+        cols = [e for e in self.E if e not in removed_set]
+        values = self.values()[:, [self.col_id[e] for e in cols]].copy()
+        self.col_nodes = [self.col_nodes[self.col_id[e]] for e in cols]
+        self.E = cols
+        self.col_id = {e: i for i, e in enumerate(cols)}
+        self.matrix = np.zeros(self.matrix.shape, dtype=np.int32)
+        self.matrix[:len(self.S), :len(cols)] = values
+        self.observed[:] = False
+        self.partitions = [ThresholdPartition(list(range(len(self.lattice.lattice_set))), self.above[0])]
+        self.observe(values)
+        for partition in self.partitions:
+            partition.add_rows(values)
+        self.version += 1
+        return removed
+
+    def threshold_row(self, s, l):
+        return self.above[self.lattice.rank(l)][self.matrix[self.row_id[s], :len(self.E)]]
 
     def equivalent_rows(self, s1, s2, l):
         # return self.equal_rows(s1, s2, l) and all(self.equal_rows(s1 + sigma, s2 + sigma, l) for sigma in self.alphabet)
-        return all([self.TL[l][s1 + e] == self.TL[l][s2 + e] for e in self.E])
+        return bool(np.array_equal(self.threshold_row(s1, l), self.threshold_row(s2, l)))
 
     def equal_rows(self, s1, s2, l):
-        T_s1 = {e: self.oracle.vq(s1 + e) if s1 + e not in self.TL[l] else self.TL[l][s1 + e] for e in self.E}
-        T_s2 = {e: self.oracle.vq(s2 + e) if s2 + e not in self.TL[l] else self.TL[l][s2 + e] for e in self.E}
+        T_s1 = {e: self.oracle.vq(s1 + e) if s1 + e not in self.T else self.T[s1 + e] for e in self.E}
+        T_s2 = {e: self.oracle.vq(s2 + e) if s2 + e not in self.T else self.T[s2 + e] for e in self.E}
         TL_s1 = {e: 1 if self.lattice.order(l, T_s1[e]) else 0 for e in self.E}
         TL_s2 = {e: 1 if self.lattice.order(l, T_s2[e]) else 0 for e in self.E}
         return all([TL_s1[e] == TL_s2[e] for e in self.E])
 
+    def real_k(self):
+        """
+        :return: the number of distinct values in the table.
+        """
+        return int(self.observed.sum())
+
+    def effective_thresholds(self):
+        """
+        Two elements of the lattice that are below exactly the same observed values threshold the table
+        the same way, so they have the same partition.
+        :return: a list of groups of lattice ranks which threshold the table the same way,
+        ordered by the first rank in each of the groups.
+        """
+        return [ranks for ranks, _ in self.threshold_partitions()]
+
+    def threshold_partitions(self):
+        """
+        :return: a list of (ranks, partition) for every group of ranks that threshold the table the same way,
+        whereas partition is of the non zero rows of S (see equivalence_classes_in_l).
+        """
+        return self.cached('threshold_partitions', lambda: [
+            (list(partition.ranks), partition.partition(self.S))
+            for partition in sorted(self.partitions, key=lambda partition: partition.ranks[0])])
+
     def equivalence_classes_in_l(self, l):
-        # the problem is here
-        classes = {}
-        states = set()
-        for s in self.S:
-            found = False
-            if self.zero_line(s, l):
-                continue
-            for state in states:
-                if self.equivalent_rows(s, state, l):
-                    classes[state].add(s)
-                    found = True
-                    break
-            if not found:
-                states.add(s)
-                classes[s] = {s}
-        partition = list(classes.values())
-        return partition
-    
+        rank = self.lattice.rank(l)
+        return next(partition for ranks, partition in self.threshold_partitions() if rank in ranks)
+
+    def equivalence_classes(self):
+        """
+        :return: the partition of S for every l in the lattice (see equivalence_classes_in_l),
+        only one of them is built for every effective threshold (see effective_thresholds).
+        """
+        partitions = [None] * len(self.lattice.lattice_set)
+        for ranks, partition in self.threshold_partitions():
+            for i in ranks:
+                partitions[i] = partition
+        return partitions
+
     def next_consistent(self, s1, s2, partitions):
         for sigma in self.alphabet:
             s1_s = s1 + sigma
@@ -104,8 +382,17 @@ class FOLStarObservationTable:
         return [set(p) for p in partition]
 
     def equivalence_partition(self):
-        partitions = [self.equivalence_classes_in_l(l) for l in self.lattice.lattice_set]
-        partitions = [part for part in partitions if part]
+        return self.cached('equivalence_partition', self.timed_partition)
+
+    def timed_partition(self):
+        if self.metrics is None:
+            return self.minimal_partition()
+        with self.metrics.phase(Metrics.Metrics.PARTITION):
+            return self.minimal_partition()
+
+    def minimal_partition(self):
+        # equal partitions would not change the minimal partition, so every effective threshold is used once
+        partitions = [part for _, part in self.threshold_partitions() if part]
         # cons_partition = self.consistency_partition(partitions)
         # print("-------------------")
         # print("all", partitions)
@@ -119,9 +406,12 @@ class FOLStarObservationTable:
         return minimal_partition
 
     def row_closed(self, s):
-        return all([s + sigma in self.S for sigma in self.alphabet])
+        return all([s + sigma in self.row_id for sigma in self.alphabet])
 
     def representative_states(self):
+        return self.cached('representative_states', self.find_representatives)
+
+    def find_representatives(self):
         minimal_partition = self.equivalence_partition()
         row_to_state = {}
         for part in minimal_partition:
@@ -145,13 +435,27 @@ class FOLStarObservationTable:
             closed = True
             rows_to_states = self.representative_states()
             states = set(rows_to_states.values())
-            if any([self.add_row(state + sigma) for state in states for sigma in self.alphabet]):
+            if self.add_rows([state + sigma for state in states for sigma in self.alphabet]):
                 closed = False
 
     def state_name(self, s):
         return s if s != '' else 'e'
 
+    def update_potentials(self, rows, cols):
+        """
+        bring the cached max_e of the rows up to date with new columns (which are the last ones in E).
+        """
+        for s in rows:
+            cur_max = self.potentials[s]
+            for e in cols:
+                value = self.value(s, e)
+                if cur_max[1] < value:
+                    cur_max = e, value
+            self.potentials[s] = cur_max
+
     def max_e(self, s):
+        if s in self.potentials:
+            return self.potentials[s][0]
         cur_max = '', self.T[s]
         for e in self.E:
             if cur_max[1] < self.T[s + e]:
@@ -159,21 +463,33 @@ class FOLStarObservationTable:
         return cur_max[0]
 
     def row_potential(self, s):
+        if s in self.potentials:
+            return self.potentials[s][1]
         max_e = self.max_e(s)
         return self.T[s + max_e]
 
     def zero_line(self, s, l):
-        return not any([self.TL[l][s + e] for e in self.E])
+        return not self.threshold_row(s, l).any()
 
     def trans_value(self, state, sigma):
         return self.row_potential(state + sigma)
 
-    def find_next_state(self, state, sigma, reps):
+    def state_members(self, reps):
+        """
+        :param reps: a map from rows to their representatives (see representative_states).
+        :return: the inverted map, from every representative to the list of its rows (in the order of reps).
+        """
+        members = {}
+        for s, rep in reps.items():
+            members.setdefault(rep, []).append(s)
+        return members
+
+    def find_next_state(self, state, sigma, reps, members=None):
+        members = self.state_members(reps) if members is None else members
         max_potential, cur_next = self.row_potential(state + sigma), reps[state + sigma]
-        for s in reps:
-            if reps[s] == state:
-                if s + sigma in self.S and self.row_potential(s + sigma) > max_potential:
-                    max_potential, cur_next = self.row_potential(s + sigma), reps[s + sigma]
+        for s in members[state]:
+            if s + sigma in self.row_id and self.row_potential(s + sigma) > max_potential:
+                max_potential, cur_next = self.row_potential(s + sigma), reps[s + sigma]
         return max_potential, cur_next
 
 
@@ -182,14 +498,15 @@ class FOLStarObservationTable:
         states = set(row_to_state.values())
 
         q_0 = lambda q: self.lattice.get_max() if self.state_name(q) == 'e' else self.lattice.get_min()
-        f = lambda q: self.lattice.find_max_lattice(lambda l: self.TL[l][q] == 1)
+        f = lambda q: self.lattice.find_max_lattice(lambda l: self.lattice.order(l, self.T[q]))
 
         automaton = LDFA.LDFA(self.alphabet, self.lattice, q_0, f)
+        members = self.state_members(row_to_state)
 
         for state in states:
             automaton.add_state(self.state_name(state), f(state))
             for sigma in self.alphabet:
-                trans_val, next_state = self.find_next_state(state, sigma, row_to_state)
+                trans_val, next_state = self.find_next_state(state, sigma, row_to_state, members)
                 automaton.add_transition(self.state_name(state), sigma, self.state_name(next_state), trans_val)
         return automaton
 
@@ -204,23 +521,35 @@ class FOLStarObservationTable:
         return False
 
     def check_consistency(self, automaton):
-        for w in self.T:
-            if self.T[w] != automaton.run_word(w):
+        """
+        :param automaton: the hypothesis, an LDFA (which is compiled by run_words on every call) or its
+        CompiledLDFA, which a caller that checks the same hypothesis again should pass.
+        :return: the first word of T whose value in the automaton is different, or None.
+        """
+        words = list(self.T)
+        for w, value in zip(words, automaton.run_words(words)):
+            if self.T[w] != value:
                 # print("not consistent with", w)
                 return w
 
+    def dimensions(self):
+        """
+        :return: (the number of rows, the number of columns).
+        """
+        return len(self.S), len(self.E)
+
     def print_table(self, file=None):
         if file is None:
             print(str(self.equivalence_partition()) + "\n")
             self.print_main_table()
-            ps = [self.equivalence_classes_in_l(l) for l in self.lattice.lattice_set]
+            ps = self.equivalence_classes()
             p = self.equivalence_partition()
             c = self.consistency_partition(p)
             print("All: \n" + str("\n".join([str(a) for a in ps])) + "\n")
             print("Consistency: " + str(c) + "\n")
             print("Result: " + str(p) + "\n")
         else:
-            ps = [self.equivalence_classes_in_l(l) for l in self.lattice.lattice_set]
+            ps = self.equivalence_classes()
             p = self.equivalence_partition()
             c = self.consistency_partition(p)
             file.write("All: \n" + str("\n".join([str(a) for a in ps])) + "\n")
@@ -254,11 +583,10 @@ class FOLStarObservationTable:
             print(colored("l = " + str(l), 'magenta'))
         else:
             file.write("l = " + str(l))
-        T_l = self.TL[l]
         to_print = [2 * [""] + self.E]  # one for s, one for the class
         for s in self.S:
             if not self.zero_line(s, l):
-                values = [T_l[s + e] for e in self.E]
+                values = [1 if v else 0 for v in self.threshold_row(s, l).tolist()]
                 to_print.append([s] + values)
 
         if file:
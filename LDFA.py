@@ -1,5 +1,6 @@
 import random
 import State
+import CompiledLDFA
 import itertools
 
 
@@ -59,6 +60,25 @@ class LDFA:
             cur_state = n_title
         return self.lattice.meet(val, self.states[cur_state].value) if not for_state else cur_state
 
+    def run_words(self, words, lengths=None, for_state=False):
+        """
+        run a batch of words on the LDFA at once (see CompiledLDFA.run_words).
+        The LDFA is compiled on every call, so a caller with several batches should compile it once
+        and run them on the CompiledLDFA.
+        :param words: a ragged list of words, or a padded integer array of letter indices.
+        :param lengths: the length of each word, if words is a padded integer array.
+        :param for_state: if True, the runs will return the states on which they ended.
+        :return: a list with the value (or the final state) of each of the words.
+        """
+        return self.compile().run_words(words, lengths, for_state)
+
+    def compile(self):
+        """
+        :return: an array backed copy of this LDFA (CompiledLDFA), which runs words much faster.
+        The copy does not follow later changes to this LDFA.
+        """
+        return CompiledLDFA.CompiledLDFA(self)
+
     def initial_state(self):
         """
         find the initial state of the LDFA
@@ -198,33 +218,14 @@ class LDFA:
     @classmethod
     def equivalent(cls, a1, a2):
         """
-        This will return a distinguishing word if a1 and a2 aren't equivalent,
-        Else, it will return None
+        This will return a shortest distinguishing word if a1 and a2 aren't equivalent,
+        Else, it will return None.
+        The product of a1 and a2 is explored on the fly (see CompiledLDFA.equivalent).
         :param a1: LDFA a1
         :param a2: LDFA a2
         :return: a distinguishing word if not equivalent, or None if a1 and a2 are.
         """
-        # we can start from e, then its neighbors, and see if there is a difference
-        alphabet = a1.alphabet
-        a1 = a1.simplify().trim()
-        a2 = a2.simplify().trim()
-
-        managed_pairs = []
-        eq_ch_pairs = [(a1.initial_state(), a2.initial_state(), "")]
-        while len(eq_ch_pairs) > 0:
-            q_1, r_1, w = eq_ch_pairs.pop()
-            for sigma in alphabet:
-                q_2 = a1.get_state(q_1).next_states(sigma)[0][1]  # getting the state title only
-                r_2 = a2.get_state(r_1).next_states(sigma)[0][1]
-                if (q_2, r_2) not in managed_pairs:
-                    if a1.get_state(q_2).value != a2.get_state(r_2).value:
-                        return w + sigma
-                        # return False
-                    elif (q_2, r_2, w + sigma) not in eq_ch_pairs:
-                        eq_ch_pairs.append((q_2, r_2, w + sigma))
-            managed_pairs.append((q_1, r_1))
-        # return True
-        return None
+        return CompiledLDFA.CompiledLDFA.equivalent(a1.compile(), a2.compile())
 
     def find_CS(self):
         paths = self.max_paths()
@@ -308,29 +309,52 @@ class LDFA:
 
     # a1 is the vqship function of the original automaton
     @classmethod
-    def random_equivalent(cls, alphabet, a1, a2):
+    def random_equivalent(cls, alphabet, a1, a2, vq_batch=None, chunk=100):
+        """
+        check a1 against a2 on 4000 random words, which are generated and run in chunks.
+        :param a2: the LDFA (or CompiledLDFA) to check, it is compiled once for all of the chunks.
+        :param vq_batch: an optional batch version of a1, (words)->values, which is asked once per chunk
+        (so it may be asked up to chunk - 1 words beyond the first difference).
+        :return: the first word on which a1 and a2 differ, or None if there is no such word.
+        The random stream is left as a word by word check would leave it.
+        """
         N = 4000
-        for i in range(N):
-            word = cls.word_generator(alphabet, random.randint(1, 10))
-            v1 = a1(word)
-            v2 = a2.run_word(word)
-            if v1 != v2:
-                return word
+        a2 = a2.compile()
+        for start in range(0, N, chunk):
+            state = random.getstate()
+            words = [cls.word_generator(alphabet, random.randint(1, 10)) for _ in range(min(chunk, N - start))]
+            values = a2.run_words(words)
+            if vq_batch is not None:
+                expected = vq_batch(words)
+                differ = next((i for i, (v1, v2) in enumerate(zip(expected, values)) if v1 != v2), None)
+            else:
+                differ = next((i for i, (word, v2) in enumerate(zip(words, values)) if a1(word) != v2), None)
+            if differ is not None:
+                # draw again only the words up to the difference, as the words after it were never needed
+                random.setstate(state)
+                for _ in range(differ + 1):
+                    cls.word_generator(alphabet, random.randint(1, 10))
+                return words[differ]
         return None
 
     # not random :)
     @classmethod
-    def equivalent_by_words(cls, alphabet, a1, a2, N=12):
-        for i in range(N):
-            all_options = [''.join(l) for l in list(itertools.product(alphabet, repeat=i))]
-            for word in all_options:
-                v1 = a1(word)
-                v2 = a2.run_word(word)
-                if v1 != v2:
-                    # print('Not equivalent on the word: {} (org={}, new={})'.format(word, v1, v2))
-                    return word
-        # print('It seems correct!')
-        return None
+    def equivalent_by_words(cls, alphabet, a1, a2, N=12, max_words=None, memo=None, return_checked=False):
+        """
+        check a1 against a2 on all the words shorter than N (see CompiledLDFA.exhaustive_equivalent).
+        :param alphabet: the letters to build words from.
+        :param a1: the membership function of the original automaton.
+        :param a2: the LDFA to check.
+        :param N: the words checked are of lengths 0..N-1.
+        :param max_words: if not None, stop after checking this many words.
+        :param memo: if not None, a dictionary {word: value} of known values of a1, which is also updated.
+        :param return_checked: if True, the number of words checked is returned as well.
+        :return: the first word on which a1 and a2 differ, or None if there is no such word
+        ((word, the number of words checked) if return_checked).
+        """
+        word, checked = a2.compile().exhaustive_equivalent(a1, N - 1, max_words=max_words, memo=memo,
+                                                           alphabet=alphabet)
+        return (word, checked) if return_checked else word
 
     def num_of_states(self):
         return len(self.states)
@@ -1,4 +1,5 @@
 import LDFA
+import WordStore
 from termcolor import colored
 import itertools
 
@@ -7,6 +8,10 @@ class LStarObservationTable:
 
     # oracle holds 2 functions:
     # vq is a function (word)->value
+    # T is a WordStore, the rows and the columns are interned in it (row_node, col_node),
+    # and the cells are read by (prefix id, suffix id), without concatenating s + e.
+    # Every row has a signature (the ranks of its values over E), and the states are found by
+    # signature (see find_state) instead of comparing the row with each of them.
     def __init__(self, lattice, alphabet, oracle):
         self.alphabet = alphabet
         self.oracle = oracle
@@ -14,12 +19,41 @@ class LStarObservationTable:
         self.states = ['']
         self.S = ['']
         self.E = ['']
-        self.T = {'': oracle.vq("")}
+        self.T = WordStore.WordStore()
+        self.T[''] = oracle.vq("")
+        self.row_node = {'': WordStore.WordStore.ROOT}
+        self.col_node = {'': WordStore.WordStore.ROOT}
+        self.col_nodes = [WordStore.WordStore.ROOT]  # the suffix ids of E, in order
         self.state_val = {'': oracle.vq("")}  # The value of the eps state is the value of the eps value
-        self.isLike = {'': ''}
+        self.signatures = {'': (self.lattice.rank(self.T['']),)}
+        self.reset_states()
         self.paths = {'': self.lattice.get_max()}
         self.table_init()
 
+    def reset_states(self):
+        self.isLike = {'': ''}
+        self.like_rows = {'': {'': None}}  # the inverse of isLike, {state: the rows like it (as dict keys)}
+        self.states = ['']
+        self.state_set = {''}
+        self.signature_state = {self.signatures['']: ''}  # {signature: the first state with it}
+
+    def add_state(self, s):
+        self.states.append(s)
+        self.state_set.add(s)
+        self.signature_state.setdefault(self.signatures[s], s)
+
+    def set_like(self, s, state):
+        if s in self.isLike:
+            del self.like_rows[self.isLike[s]][s]
+        self.isLike[s] = state
+        self.like_rows.setdefault(state, {})[s] = None
+
+    def find_state(self, s):
+        """
+        :return: the first state whose row equals the row of s, or None if there is no such state.
+        """
+        return self.signature_state.get(self.signatures[s])
+
     def table_init(self):
         """Init the table of the words values (The T table)
            Once initialized, the table will include a column for the empty word (epsilon),
@@ -39,8 +73,7 @@ class LStarObservationTable:
         """
         # Init the likes data structure and the unique states
         # (each time we close the table we start over)
-        self.isLike = {'': ''}
-        self.states = ['']
+        self.reset_states()
         closed = False
         while not closed:
             closed = self.add_closure()
@@ -52,13 +85,12 @@ class LStarObservationTable:
         """
         for s in self.S:
             if s not in self.isLike:
-                for state in self.states:
-                    if self.equiv_rows(state, s):
-                        self.isLike[s] = state
-                        break
+                state = self.find_state(s)
+                if state is not None:
+                    self.set_like(s, state)
             if s not in self.isLike:
-                self.isLike[s] = s
-                self.states.append(s)
+                self.set_like(s, s)
+                self.add_state(s)
 
     def add_closure(self):
         """
@@ -67,11 +99,11 @@ class LStarObservationTable:
         """
         closed = True
         prev_s = list(self.states)
+        self.add_rows([s + a for s in prev_s for a in self.alphabet])
         for s in prev_s:
             for a in self.alphabet:
-                self.add_row(s + a)
                 if self.is_unique(s + a):
-                    self.states.append(s + a)
+                    self.add_state(s + a)
                     closed = False
         return closed
 
@@ -79,48 +111,104 @@ class LStarObservationTable:
         """
         Insert a new column to the table.
         Update the state value that each row holds according to it.
+        :return: True if the column is new.
+        """
+        if e in self.E:
+            return False
+        c = self.col_node[e] = self.T.suffix(e)
+        self.query([(self.row_node[s], c) for s in self.S])
+        for s in self.S:
+            self.resolve_state_val(s)
+            if self.is_unique(s):
+                self.add_state(s)
+        self.E.append(e)
+        self.col_nodes.append(c)
+        for s in self.S:
+            self.signatures[s] += (self.lattice.rank(self.T.get_cell(self.row_node[s], c)),)
+        self.index_states()
+        return True
+
+    def index_states(self):
         """
-        if e not in self.E:
-            for s in self.S:
-                self.T[s + e] = self.oracle.vq(s + e)
-                self.resolve_state_val(s)
-                if self.is_unique(s):
-                    self.states.append(s)
-            self.E.append(e)
+        map the signatures of the states to them again, once the signatures change.
+        """
+        self.signature_state = {}
+        for state in self.states:
+            self.signature_state.setdefault(self.signatures[state], state)
 
     def add_row(self, s):
         """
         Insert a new row @s to the table.
         Update the state value that this row holds.
         """
-        if s not in self.S:
+        self.add_rows([s])
+
+    def add_rows(self, rows):
+        """
+        Insert new rows to the table, all of their cells are queried in one batch.
+        """
+        rows = [s for s in dict.fromkeys(rows) if s not in self.row_node]
+        for s in rows:
+            self.row_node[s] = self.T.prefix(s)
+        self.query([(self.row_node[s], self.col_node[e]) for s in rows for e in self.E])
+        for s in rows:
             self.S.append(s)
-            for e in self.E:
-                self.T[s + e] = self.oracle.vq(s + e)
             self.resolve_state_val(s)
+            self.signatures[s] = tuple(self.lattice.rank(self.T.get_cell(self.row_node[s], c))
+                                       for c in self.col_nodes)
+
+    def query(self, cells):
+        """
+        Ask the oracle, in a single batch, for the values of the cells (prefix id, suffix id) which are not in T yet.
+        """
+        missing = list(dict.fromkeys(self.T.canonical(p, c) for p, c in cells if not self.T.has_cell(p, c)))
+        if missing:
+            for (p, c), value in zip(missing, self.oracle.vq_batch([self.T.word(p, c) for p, c in missing])):
+                self.T.set_cell(p, c, value)
 
     def add_counter_example(self, word):
         """
         Add counter example to the table (rows and columns)
         """
+        suffixes = [self.T.suffix(word[i:]) for i in range(len(word))]
+        self.query([(self.row_node[s], c) for c in suffixes for s in self.S])
         for i in range(len(word)):
             suffix = word[i:len(word)]
             if suffix not in self.E:
                 self.add_col(suffix)
 
+    def compact(self):
+        """
+        drop columns from E while no two distinct rows of S become equal (the newest columns first,
+        the empty suffix is always kept). Their values stay in T.
+        As for the FOL* table (see FOLStarObservationTable.compact), this trades the size of E for
+        more MQs and EQs, since a dropped column may be needed again to separate later rows.
+        :return: the list of the dropped columns.
+        """
+        rows = set(self.signatures.values())
+        kept = list(range(len(self.E)))
+        removed = []
+        for j in reversed(range(1, len(self.E))):
+            i = kept.index(j)
+            reduced = set(row[:i] + row[i + 1:] for row in rows)
+            if len(reduced) == len(rows):
+                rows = reduced
+                kept.remove(j)
+                removed.append(self.E[j])
+        self.E = [self.E[j] for j in kept]
+        self.col_nodes = [self.col_nodes[j] for j in kept]
+        self.signatures = {s: tuple(signature[j] for j in kept) for s, signature in self.signatures.items()}
+        self.index_states()
+        return removed
+
     def resolve_state_val(self, s):
         """
         Find the state value according to a possible contradiction found in the row s, with col e
         """
-        self.state_val[s] = self.T[s]
+        self.state_val[s] = self.T.get_cell(self.row_node[s], WordStore.WordStore.ROOT)
 
     def get_all_like(self, row):
-        row = self.isLike[row]
-        like = []
-        for s in self.S:
-            if s in self.isLike and self.isLike[s] == row:
-                like.append(s)
-        return like
+        return list(self.like_rows[self.isLike[row]])
 
     def meet_state_vals(self, lines):
         lat = self.lattice.get_max()
@@ -129,7 +217,7 @@ class LStarObservationTable:
         return lat
 
     def get_full_state_val(self, s):
-        return self.T[s]
+        return self.T.get_cell(self.row_node[s], WordStore.WordStore.ROOT)
 
     def equiv_rows(self, s1, s2):
         """
@@ -140,20 +228,22 @@ class LStarObservationTable:
         return self.equal_rows(s1, s2)
 
     def equal_rows(self, s1, s2):
-        for e in self.E:
-            if self.T[s1 + e] != self.T[s2 + e]:
+        p1, p2 = self.row_node[s1], self.row_node[s2]
+        get = self.T.get_cell
+        for c in self.col_nodes:
+            if get(p1, c) != get(p2, c):
                 return False
         return True
 
     def is_unique(self, s):
-        if s in self.states:
-            self.isLike[s] = s
+        if s in self.state_set:
+            self.set_like(s, s)
             return False
-        for row in self.states:
-            if self.equiv_rows(row, s):
-                self.isLike[s] = row
-                return False
-        self.isLike[s] = s
+        state = self.find_state(s)
+        if state is not None:
+            self.set_like(s, state)
+            return False
+        self.set_like(s, s)
         return True
 
 
@@ -163,8 +253,14 @@ class LStarObservationTable:
         return self.lattice.get_max()
 
     def check_consistency(self, automaton):
-        for w in self.T:
-            if self.T[w] != automaton.run_word(w):
+        """
+        :param automaton: the hypothesis, an LDFA (which is compiled by run_words on every call) or its
+        CompiledLDFA, which a caller that checks the same hypothesis again should pass.
+        :return: the first word of T whose value in the automaton is different, or None.
+        """
+        words = list(self.T)
+        for w, value in zip(words, automaton.run_words(words)):
+            if self.T[w] != value:
                 # print("not consistent with", w)
                 return w
 
@@ -182,12 +278,18 @@ class LStarObservationTable:
                 # trans_value = self.T[(next, "")] # trying something different
                 trans_value = self.find_trans_val(state, sigma)
                 # join bw all equiv rows e.
-                if next not in self.states:
+                if next not in self.state_set:
                     next = self.isLike[next]
                     next_name = next if next != "" else "e"
                 automaton.add_transition(state_name, sigma, next_name, trans_value)
         return automaton
 
+    def dimensions(self):
+        """
+        :return: (the number of rows, the number of columns).
+        """
+        return len(self.S), len(self.E)
+
     def print_table(self, file=None):
         if file is None:
             self.print_main_table()
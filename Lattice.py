@@ -1,5 +1,7 @@
 from itertools import chain, combinations
 
+import numpy as np
+
 
 # lattice functions for numbers
 numbers_join = lambda x1, x2: max(x1, x2)
@@ -41,6 +43,16 @@ class Lattice:
         self.lat_str = lat_str
         self.min_element = self.find_min()
         self.max_element = self.find_max()
+        try:
+            self.ranks = {l: i for i, l in enumerate(lattice_set)}
+        except TypeError:  # unhashable elements (sets), ranks are found by a scan
+            self.ranks = {}
+        # for a lattice of small non negative integers (the numbers lattice), rank_lookup[v] is the rank of v
+        self.rank_lookup = None
+        if all(type(l) is int for l in lattice_set) and 0 <= min(lattice_set) and max(lattice_set) < 1 << 20:
+            self.rank_lookup = np.full(max(lattice_set) + 1, -1, dtype=np.int32)
+            self.rank_lookup[list(lattice_set)] = np.arange(len(lattice_set), dtype=np.int32)
+        self._meet_table = None
 
     def find_min(self):
         _min = self.lattice_set[0]
@@ -62,6 +74,38 @@ class Lattice:
     def get_max(self):
         return self.max_element
 
+    def rank(self, l):
+        """
+        :param l: an element of the lattice.
+        :return: the integer rank of l, which is its index in lattice_set.
+        """
+        try:
+            return self.ranks[l]
+        except (KeyError, TypeError):
+            return self.lattice_set.index(l)
+
+    def rank_array(self, values):
+        """
+        :param values: a list of elements of the lattice.
+        :return: an integer array of their ranks, mapped at once through rank_lookup if the lattice has one.
+        """
+        if self.rank_lookup is not None and values:
+            array = np.asarray(values)
+            if array.dtype.kind in "iu" and array.min() >= 0 and array.max() < len(self.rank_lookup):
+                ranks = self.rank_lookup[array]
+                if ranks.min() >= 0:
+                    return ranks
+        return np.array([self.rank(l) for l in values], dtype=np.int32)
+
+    def meet_table(self):
+        """
+        :return: a table t for which t[i][j] is the rank of the meet of the elements of ranks i and j.
+        """
+        if self._meet_table is None:
+            self._meet_table = [[self.rank(self.meet(l1, l2)) for l2 in self.lattice_set]
+                                for l1 in self.lattice_set]
+        return self._meet_table
+
     def complement(self, l):
         return self.comp(self.get_max(), l)
 
@@ -158,27 +158,29 @@ def learn_weighted(alphabet, oracle):
 # learn_weighted(["a", "b"], Oracle(my_language,
 #                                   lambda a: True))
 
-from Tests.Run_Test import generate_random_LDFA
-import Oracle
-import LDFA
+# an example run, guarded so the module can be imported (see Tests/Benchmark.py)
+if __name__ == '__main__':
+    from Tests.Run_Test import generate_random_LDFA
+    import Oracle
+    import LDFA
 
-lattice = Lattice.Lattice.numbers_lattice(list(range(10)))
-alphabet = ['a', 'b']
-expected_automaton = LDFA.LDFA.create_by_input(alphabet, lattice, "Examples/full_ordered1.txt")
-vq = lambda word: expected_automaton.run_word(word)
+    lattice = Lattice.Lattice.numbers_lattice(list(range(10)))
+    alphabet = ['a', 'b']
+    expected_automaton = LDFA.LDFA.create_by_input(alphabet, lattice, "Examples/full_ordered1.txt")
+    vq = lambda word: expected_automaton.run_word(word)
 
-expected_automaton.print_automaton()
+    expected_automaton.print_automaton()
 
-def equiv(automata):
-    print("EQ")
-    return True
+    def equiv(automata):
+        print("EQ")
+        return True
 
-oracle = Oracle.Oracle(vq, equiv)
+    oracle = Oracle.Oracle(vq, equiv)
 
-# m = generate_random_LDFA(['a', 'b'], lattice, number_of_states=10, state_values=True)
-# oracle = Oracle.Oracle(lambda w: m.run_word(w), "")
+    # m = generate_random_LDFA(['a', 'b'], lattice, number_of_states=10, state_values=True)
+    # oracle = Oracle.Oracle(lambda w: m.run_word(w), "")
 
-learn_weighted(['a', 'b'], oracle)
+    learn_weighted(['a', 'b'], oracle)
 
 
 #
@@ -1,5 +1,12 @@
+import asyncio
+import warnings
+import CounterExampleProcessor
+import DiscriminationTree
 import FOLStarObservationTable
 import LStarObservationTable
+import Metrics
+import Oracle
+import Profiler
 from LDFA import LDFA
 
 
@@ -7,58 +14,123 @@ class LearningAlgorithm:
 
     FOLSTAR_TABLE = 1
     LSTAR_TABLE = 2
+    DTREE = 3
 
-    successes = 0
-    nums_of_states = []
-    changes = []
-    cur_success = False
+    ALL_SUFFIXES = 1  # every suffix of a counterexample becomes a column
+    RS_SUFFIX = 2  # a single distinguishing suffix is searched for (see CounterExampleProcessor)
 
-    def __init__(self, lattice, oracle, alphabet, original=None, table=1):
+    def __init__(self, lattice, oracle, alphabet, original=None, table=1, counter_mode=1):
+        """
+        The costs of the run are kept in self.metrics (see Metrics).
+        """
         self.lattice = lattice
         self.oracle = oracle
         self.alphabet = alphabet
+        # the learner's membership queries go through a counting oracle, the equivalence checks do not
+        counted = Oracle.CountingOracle(oracle)
 
         if table == LearningAlgorithm.LSTAR_TABLE:
-            self.table = LStarObservationTable.LStarObservationTable(lattice, alphabet, oracle)
+            self.table = LStarObservationTable.LStarObservationTable(lattice, alphabet, counted)
+        elif table == LearningAlgorithm.DTREE:
+            self.table = DiscriminationTree.DiscriminationTree(lattice, alphabet, counted)
         else:
-            self.table = FOLStarObservationTable.FOLStarObservationTable(lattice, alphabet, oracle)
+            self.table = FOLStarObservationTable.FOLStarObservationTable(lattice, alphabet, counted)
 
+        self.table_type = table
         self.original = original
+        self.counter_mode = counter_mode
+        self.counter_processor = CounterExampleProcessor.CounterExampleProcessor(counted)
+        self.metrics = Metrics.Metrics(counted, self.table)
+        if isinstance(self.table, FOLStarObservationTable.FOLStarObservationTable):
+            self.table.metrics = self.metrics
+        self.profiler = None
+        # the maximal number of EQs, None for no limit
         self.MAX_ITERATIONS = 15
-        self.EQs = 0
-        LearningAlgorithm.nums_of_states = []
-        LearningAlgorithm.changes = []
-        LearningAlgorithm.cur_success = False
-
-    def run_algorithm(self, file=None):
+        self.EQ_MAX_LENGTH = 11  # used when there is no original automaton to check against
+        self.EQ_MAX_WORDS = None
+        # if True (and there is no original automaton), the EQs check random words (see LDFA.random_equivalent)
+        # instead of all of the words up to EQ_MAX_LENGTH
+        self.EQ_RANDOM = False
+        # the membership queries that may be spent shortening a counterexample. Only the random EQs are
+        # shortened: the other EQs already return a shortest counterexample (a BFS, or the words by length)
+        self.SHORTEN_BUDGET = 0
+        # if not 0, the table drops its redundant columns after every that many EQs, which keeps E small
+        # at the price of more MQs and EQs (see FOLStarObservationTable.compact)
+        self.COMPACT_EVERY = 0
+        self.checked_words = 0
+        self.eq_memo = {}  # the values of the words checked in earlier equivalence queries
+
+    def run_algorithm(self, file=None, profile=None):
+        """
+        :param profile: if not None, a path prefix: the phases of the run are profiled (see Profiler.PhaseProfiler),
+        and the per-phase statistics are written to <profile>.txt and the collapsed stacks to <profile>.collapsed.
+        The profiler is kept in self.profiler.
+        """
+        if profile is None:
+            return self.learn(file)
+        self.profiler = Profiler.PhaseProfiler()
+        with self.profiler.attached(self.metrics):
+            automaton = self.learn(file)
+        self.profiler.write(profile, self.metrics)
+        return automaton
+
+    def learn(self, file=None):
         ok = False
         automaton = None
+        metrics = self.metrics
 
-        LearningAlgorithm.nums_of_states = []
-        LearningAlgorithm.changes = []
-        LearningAlgorithm.cur_success = False
-
-        for i in range(self.MAX_ITERATIONS):
-            if ok:
-                break
-            self.table.close()
-            automaton = self.table.create_automaton()
+        while not ok and (self.MAX_ITERATIONS is None or metrics.equivalence_queries < self.MAX_ITERATIONS):
+            with metrics.phase(Metrics.Metrics.CLOSE):
+                self.table.close()
+            with metrics.phase(Metrics.Metrics.HYPOTHESIS):
+                automaton = self.table.create_automaton()
 
             # self.table.print_table(file)
-            LearningAlgorithm.nums_of_states += [len(automaton.states)]
+            metrics.hypothesis_sizes.append(len(automaton.states))
             # automaton.print_automaton(file)
-            counter_example = self.recommend_counter(automaton)
-            self.EQs += 1
+            with metrics.phase(Metrics.Metrics.EQUIVALENCE):
+                counter_example = self.recommend_counter(automaton)
+            metrics.equivalence_queries += 1
 
             if counter_example is None:  # the conjecture is correct!
                 ok = True
-                LearningAlgorithm.successes += 1
-                LearningAlgorithm.cur_success = True
+                metrics.success = True
             else:
                 # self.debug_print("Counter Example: " + counter_example, file)
-                self.table.add_counter_example(counter_example)
+                with metrics.phase(Metrics.Metrics.COUNTER_EXAMPLE):
+                    self.add_counter_example(automaton, counter_example)
+                    if self.COMPACT_EVERY and metrics.equivalence_queries % self.COMPACT_EVERY == 0 \
+                            and self.table_type != LearningAlgorithm.DTREE:
+                        self.table.compact()
+        if not ok:
+            warnings.warn("the learning stopped after {} EQs, and its last hypothesis is not equivalent to the target"
+                          .format(metrics.equivalence_queries))
         return automaton  # self.table.create_automaton()
 
+    async def run_algorithm_async(self, file=None, profile=None):
+        """
+        run the algorithm from a coroutine, with an Oracle.AsyncOracle whose vq needs the running event loop.
+        The learning loop runs in a worker thread, and the oracle's batches are dispatched concurrently
+        on the running loop, so the loop is free to serve them meanwhile.
+        """
+        self.oracle.loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.to_thread(self.run_algorithm, file, profile)
+        finally:
+            self.oracle.loop = None
+
+    def add_counter_example(self, automaton, counter_example):
+        """
+        update the table with a counterexample for the automaton, according to the counter mode.
+        When no new distinguishing suffix is found, all of the suffixes are added.
+        """
+        # the discrimination tree always decomposes its counterexamples itself
+        if self.counter_mode == LearningAlgorithm.RS_SUFFIX and self.table_type != LearningAlgorithm.DTREE:
+            suffix = self.counter_processor.distinguishing_suffix(automaton, counter_example, self.table.T)
+            if suffix is not None and self.table.add_col(suffix):
+                return
+        self.table.add_counter_example(counter_example)
+
     def table_size(self):
         return len(self.table.T)
 
@@ -84,6 +156,16 @@ class LearningAlgorithm:
     # return a counterexample if there is one, else return None
     def recommend_counter(self, automaton):
         if self.original is not None:
-            return LDFA.equivalent(self.original, automaton)
+            counter_example = LDFA.equivalent(self.original, automaton)
+        elif self.EQ_RANDOM:
+            counter_example = LDFA.random_equivalent(self.alphabet, self.oracle.vq, automaton.compile(),
+                                                     vq_batch=self.oracle.vq_batch)
+            if counter_example is not None and self.SHORTEN_BUDGET > 0:
+                counter_example = self.counter_processor.shorten(automaton, counter_example, self.SHORTEN_BUDGET,
+                                                                 self.table.T)
         else:
-            return LDFA.equivalent_by_words(self.alphabet, self.oracle.vq, automaton)
+            counter_example, checked = automaton.compile().exhaustive_equivalent(
+                self.oracle.vq, self.EQ_MAX_LENGTH, max_words=self.EQ_MAX_WORDS, vq_batch=self.oracle.vq_batch,
+                memo=self.eq_memo)
+            self.checked_words += checked
+        return counter_example
@@ -0,0 +1,83 @@
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    The costs of one run of a LearningAlgorithm: the membership queries (all of them and the distinct
+    words), the equivalence queries, the dimensions of the table, the size of every hypothesis, and the
+    wall time of each phase of the learning loop.
+    Callbacks registered with add_callback are called at every phase boundary, as
+    callback(phase, event, metrics) whereas event is Metrics.START or Metrics.END.
+    A phase may run inside another one (the partition of the FOL* table runs inside close or hypothesis),
+    the time of the inner phase is then not counted in the outer one.
+    """
+
+    CLOSE = "close"
+    PARTITION = "partition"  # the equivalence partition of the FOL* table
+    HYPOTHESIS = "hypothesis"
+    EQUIVALENCE = "equivalence"  # includes the shortening of the counterexample (see recommend_counter)
+    COUNTER_EXAMPLE = "counter_example"
+    PHASES = (CLOSE, PARTITION, HYPOTHESIS, EQUIVALENCE, COUNTER_EXAMPLE)
+
+    START = "start"
+    END = "end"
+
+    def __init__(self, oracle, table):
+        """
+        :param oracle: the Oracle.CountingOracle the table asks its queries through.
+        :param table: the table (or discrimination tree) of the run.
+        """
+        self.oracle = oracle
+        self.table = table
+        self.equivalence_queries = 0
+        self.hypothesis_sizes = []  # the number of states of the hypothesis of every round
+        self.phase_times = {phase: 0.0 for phase in Metrics.PHASES}
+        self.success = False
+        self.callbacks = []
+        self.running = []  # the phases that run now, the innermost last
+        self.started = 0.0  # the time the innermost phase started (or resumed) at
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self.callbacks.remove(callback)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        time the block as the phase name, and call the callbacks before and after it.
+        """
+        for callback in self.callbacks:
+            callback(name, Metrics.START, self)
+        now = time.perf_counter()
+        if self.running:
+            self.phase_times[self.running[-1]] += now - self.started
+        self.running.append(name)
+        self.started = now
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.phase_times[name] += now - self.started
+            self.running.pop()
+            self.started = now
+            for callback in self.callbacks:
+                callback(name, Metrics.END, self)
+
+    def membership_queries(self):
+        return self.oracle.queries()
+
+    def unique_queries(self):
+        return self.oracle.unique_queries()
+
+    def dimensions(self):
+        return self.table.dimensions()
+
+    def as_dict(self):
+        rows, columns = self.dimensions()
+        return {"MQ": self.membership_queries(), "unique_MQ": self.unique_queries(),
+                "EQ": self.equivalence_queries, "rows": rows, "columns": columns,
+                "hypothesis_sizes": list(self.hypothesis_sizes), "times": dict(self.phase_times),
+                "success": self.success}
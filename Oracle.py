@@ -1,5 +1,393 @@
+import ast
+import asyncio
+import os
+import sqlite3
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
 class Oracle:
 
-    def __init__(self, vq, eq):
+    def __init__(self, vq, eq, vq_batch=None):
+        """
+        :param vq: the membership function (word)->value.
+        :param eq: the equivalence function.
+        :param vq_batch: an optional function (words)->values which answers many membership queries at once.
+        """
         self.vq = vq
         self.eq = eq
+        if vq_batch is not None:
+            self.vq_batch = vq_batch
+
+    def vq_batch(self, words):
+        """
+        answer a batch of membership queries, by asking vq for each of the words.
+        :return: a list with the value of each of the words, in the same order.
+        """
+        return [self.vq(word) for word in words]
+
+
+class QueryCache:
+    """
+    A cache of membership query answers {word: value}, with LRU eviction once max_size words are held.
+    One cache can be shared by several CachingOracles (and so by several LearningAlgorithm instances)
+    that query the same target.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.values = OrderedDict()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, word):
+        return word in self.values
+
+    def get(self, word):
+        """
+        :return: (True, value) if the word is cached, else (False, None).
+        """
+        if word not in self.values:
+            return False, None
+        self.values.move_to_end(word)
+        return True, self.values[word]
+
+    def put(self, word, value):
+        self.values[word] = value
+        self.values.move_to_end(word)
+        if self.max_size is not None and len(self.values) > self.max_size:
+            self.values.popitem(last=False)
+
+
+class CachingOracle(Oracle):
+    """
+    An oracle that remembers the answers of the membership queries it passed on to vq.
+    hits and misses count the queries answered by the cache and by vq,
+    and unique_queries counts the distinct words that were asked.
+    """
+
+    def __init__(self, vq, eq, max_size=None, cache=None, vq_batch=None):
+        """
+        :param vq: the membership function (word)->value of the target.
+        :param eq: the equivalence function.
+        :param max_size: the maximal number of cached words (None for unbounded).
+        :param cache: a QueryCache to share with other oracles, in which case max_size is ignored.
+        :param vq_batch: an optional batch membership function of the target, used for the cache misses.
+        """
+        super().__init__(self.cached_vq, eq)
+        self.target_vq = vq
+        self.target_vq_batch = vq_batch if vq_batch is not None else lambda words: [vq(word) for word in words]
+        self.cache = cache if cache is not None else QueryCache(max_size)
+        self.hits = 0
+        self.misses = 0
+        self.asked = set()
+
+    def cached_vq(self, word):
+        self.asked.add(word)
+        found, value = self.cache.get(word)
+        if found:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = self.target_vq(word)
+        self.cache.put(word, value)
+        return value
+
+    def vq_batch(self, words):
+        """
+        answer a batch of membership queries, the cache misses are passed on to the target in one batch.
+        """
+        self.asked.update(words)
+        values = {}
+        for word in words:
+            found, value = self.cache.get(word)
+            if found:
+                values[word] = value
+        missing = list(dict.fromkeys(word for word in words if word not in values))
+        if missing:
+            for word, value in zip(missing, self.target_vq_batch(missing)):
+                self.cache.put(word, value)
+                values[word] = value
+        self.misses += len(missing)
+        self.hits += len(words) - len(missing)
+        return [values[word] for word in words]
+
+    def queries(self):
+        return self.hits + self.misses
+
+    def unique_queries(self):
+        return len(self.asked)
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+        self.asked = set()
+
+
+class CountingOracle(Oracle):
+    """
+    An oracle that passes every query on to another oracle and counts them:
+    queries counts all of the membership queries, and unique_queries the distinct words that were asked.
+    """
+
+    def __init__(self, oracle):
+        super().__init__(self.counted_vq, oracle.eq)
+        self.oracle = oracle
+        self.total = 0
+        self.asked = set()
+
+    def counted_vq(self, word):
+        self.total += 1
+        self.asked.add(word)
+        return self.oracle.vq(word)
+
+    def vq_batch(self, words):
+        self.total += len(words)
+        self.asked.update(words)
+        return self.oracle.vq_batch(words)
+
+    def queries(self):
+        return self.total
+
+    def unique_queries(self):
+        return len(self.asked)
+
+
+class PersistentOracle(Oracle):
+    """
+    An oracle that keeps the answers of the membership queries in an SQLite file,
+    as (target id, word) -> value, so a restarted campaign does not ask the target again.
+    The file is in WAL mode: several worker processes (each with its own PersistentOracle)
+    can read it while one of them writes. New answers are inserted in bulk, one transaction
+    per batch_size answers, so call flush() or close() (or use a with block) when done.
+    """
+
+    def __init__(self, vq, eq, path, target_id, batch_size=1000, encode=repr, decode=ast.literal_eval,
+                 vq_batch=None):
+        """
+        :param vq: the membership function (word)->value of the target.
+        :param eq: the equivalence function.
+        :param path: the path of the SQLite file (created if needed).
+        :param target_id: a string which identifies the target in the store.
+        :param batch_size: the number of new answers to collect before writing them.
+        :param encode: a function (value)->string used to store the values.
+        :param decode: a function (string)->value, the inverse of encode.
+        :param vq_batch: an optional batch membership function of the target, used for the missing words.
+        """
+        super().__init__(self.stored_vq, eq)
+        self.target_vq = vq
+        self.target_vq_batch = vq_batch if vq_batch is not None else lambda words: [vq(word) for word in words]
+        self.path = path
+        self.target_id = str(target_id)
+        self.batch_size = batch_size
+        self.encode = encode
+        self.decode = decode
+        self.hits = 0
+        self.misses = 0
+        self.pending = {}
+        # transactions are opened explicitly (see flush)
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS queries ("
+                                "target TEXT NOT NULL, word TEXT NOT NULL, value TEXT NOT NULL, "
+                                "PRIMARY KEY (target, word)) WITHOUT ROWID")
+
+    def stored_vq(self, word):
+        if word in self.pending:
+            self.hits += 1
+            return self.pending[word]
+        row = self.connection.execute("SELECT value FROM queries WHERE target = ? AND word = ?",
+                                      (self.target_id, word)).fetchone()
+        if row is not None:
+            self.hits += 1
+            return self.decode(row[0])
+        self.misses += 1
+        value = self.target_vq(word)
+        self.pending[word] = value
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return value
+
+    def vq_batch(self, words):
+        """
+        answer a batch of membership queries: the stored words are read with a few selects,
+        and the missing ones are passed on to the target in one batch.
+        """
+        values = {word: self.pending[word] for word in words if word in self.pending}
+        to_read = list(dict.fromkeys(word for word in words if word not in values))
+        for i in range(0, len(to_read), 500):
+            chunk = to_read[i:i + 500]
+            rows = self.connection.execute("SELECT word, value FROM queries WHERE target = ? AND word IN ({})"
+                                           .format(", ".join("?" * len(chunk))), [self.target_id] + chunk)
+            values.update((word, self.decode(value)) for word, value in rows)
+        missing = [word for word in to_read if word not in values]
+        if missing:
+            new_values = self.target_vq_batch(missing)
+            values.update(zip(missing, new_values))
+            self.pending.update(zip(missing, new_values))
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+        self.misses += len(missing)
+        self.hits += len(words) - len(missing)
+        return [values[word] for word in words]
+
+    def flush(self):
+        """
+        write the pending answers to the store, in a single transaction.
+        """
+        if not self.pending:
+            return
+        rows = [(self.target_id, word, self.encode(value)) for word, value in self.pending.items()]
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.executemany("INSERT OR IGNORE INTO queries (target, word, value) VALUES (?, ?, ?)", rows)
+            self.connection.execute("COMMIT")
+        except sqlite3.Error:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.pending = {}
+
+    def stored_queries(self):
+        """
+        :return: the number of answers stored for this target.
+        """
+        self.flush()
+        return self.connection.execute("SELECT COUNT(*) FROM queries WHERE target = ?",
+                                       (self.target_id,)).fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AsyncOracle(Oracle):
+    """
+    An oracle for an asynchronous membership function (async def vq(word)).
+    The words of a batch are dispatched concurrently, at most `concurrency` of them at a time,
+    and their values are returned in the order of the words, whatever order they complete in,
+    so the table is filled the same way as with a serial oracle.
+    The coroutines run on `loop` if it is set (see LearningAlgorithm.run_algorithm_async),
+    else on a private event loop in a background thread.
+    """
+
+    def __init__(self, vq, eq, concurrency=16, loop=None):
+        super().__init__(self.blocking_vq, eq)
+        self.async_vq = vq
+        self.concurrency = concurrency
+        self.loop = loop
+        self.private_loop = None
+
+    async def gather(self, words):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def ask(word):
+            async with semaphore:
+                return await self.async_vq(word)
+
+        return await asyncio.gather(*[ask(word) for word in words])
+
+    def run(self, coroutine):
+        loop = self.loop
+        if loop is None:
+            if self.private_loop is None:
+                self.private_loop = asyncio.new_event_loop()
+                threading.Thread(target=self.private_loop.run_forever, daemon=True).start()
+            loop = self.private_loop
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    def blocking_vq(self, word):
+        return self.run(self.async_vq(word))
+
+    def vq_batch(self, words):
+        unique = list(dict.fromkeys(words))
+        values = dict(zip(unique, self.run(self.gather(unique))))
+        return [values[word] for word in words]
+
+    def close(self):
+        if self.private_loop is not None:
+            self.private_loop.call_soon_threadsafe(self.private_loop.stop)
+            self.private_loop = None
+
+
+class ProcessOracle(Oracle):
+    """
+    An oracle for a target implemented as an external program, which reads one word per line
+    on its stdin and writes the value of that word as one line on its stdout (in the same order).
+    `workers` copies of the program are kept running for the whole learning. A batch is split between
+    them, each worker gets all of its words written ahead (pipelined) while its answers are read,
+    and the values are put back in the order of the words.
+    The batches are asked one at a time (a lock is held while the workers answer), so the lines of
+    concurrent batches are never mixed on the pipes of a worker.
+    """
+
+    def __init__(self, command, eq, workers=None, decode=ast.literal_eval):
+        """
+        :param command: the command line of the target program (as for subprocess.Popen).
+        :param eq: the equivalence function.
+        :param workers: the number of worker processes (the number of CPUs by default).
+        :param decode: a function (string)->value for the lines the program writes.
+        """
+        super().__init__(self.single_vq, eq)
+        self.command = command
+        self.decode = decode
+        workers = workers if workers is not None else os.cpu_count() or 1
+        self.processes = [subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                           text=True, bufsize=1) for _ in range(workers)]
+        # a reader and a writer thread per worker, which is enough as a single batch runs at a time
+        self.executor = ThreadPoolExecutor(max_workers=2 * workers)
+        self.lock = threading.Lock()
+
+    def ask_worker(self, process, words):
+        # the words are written by another thread, so a full stdout pipe can not block the writing
+        def write():
+            process.stdin.writelines(word + "\n" for word in words)
+            process.stdin.flush()
+
+        writing = self.executor.submit(write)
+        values = []
+        for _ in words:
+            line = process.stdout.readline()
+            if not line:
+                raise RuntimeError("The target program {} exited".format(self.command))
+            values.append(self.decode(line[:-1]))
+        writing.result()
+        return values
+
+    def single_vq(self, word):
+        return self.vq_batch([word])[0]
+
+    def vq_batch(self, words):
+        if not words:
+            return []
+        for word in words:
+            if "\n" in word:
+                raise ValueError("The word {!r} contains a line break, which the target program can not read"
+                                 .format(word))
+        size = -(-len(words) // len(self.processes))
+        chunks = [words[i:i + size] for i in range(0, len(words), size)]
+        with self.lock:
+            answers = [self.executor.submit(self.ask_worker, process, chunk)
+                       for process, chunk in zip(self.processes, chunks)]
+            return [value for answer in answers for value in answer.result()]
+
+    def close(self):
+        for process in self.processes:
+            process.stdin.close()
+        for process in self.processes:
+            process.wait()
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,138 @@
+import cProfile
+import io
+import os
+import pstats
+import signal
+import threading
+from contextlib import contextmanager
+
+import Metrics
+
+
+class PhaseProfiler:
+    """
+    A profiler of the phases of a learning run, driven by the phase callbacks of Metrics.
+    By default it samples: every `interval` seconds of CPU time (SIGPROF) the stack of the learning is
+    recorded under the phases that run at that moment, which costs little and gives, per phase, the
+    cumulative and the self samples of every function, and the collapsed stacks of a flame graph
+    ("phase;file:function;... count" lines, as flamegraph.pl and speedscope read them).
+    If deterministic is True (or the learning does not run in the main thread, where the signal is
+    handled), every phase is profiled with its own cProfile instead, which is exact but slower.
+    """
+
+    def __init__(self, interval=0.005, deterministic=False):
+        self.interval = interval
+        self.deterministic = deterministic
+        self.running = []  # the phases that run now, the innermost last
+        self.samples = {}  # {(phases, stack): count}, whereas stack is a tuple of frames, the outermost first
+        self.profiles = {}  # {phase: cProfile.Profile}, when deterministic
+        self.previous_handler = None
+
+    def __call__(self, phase, event, metrics):
+        if event == Metrics.Metrics.START:
+            if self.deterministic:
+                if self.running:
+                    self.profiles[self.running[-1]].disable()
+                self.profiles.setdefault(phase, cProfile.Profile()).enable()
+            self.running.append(phase)
+        else:
+            self.running.pop()
+            if self.deterministic:
+                self.profiles[phase].disable()
+                if self.running:
+                    self.profiles[self.running[-1]].enable()
+
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+            if code.co_name == "learn" and code.co_filename.endswith("LearningAlgorithm.py"):
+                break  # the frames above the learning loop are the same in all of the samples
+            frame = frame.f_back
+        key = (tuple(self.running) or ("learning",), tuple(reversed(stack)))
+        self.samples[key] = self.samples.get(key, 0) + 1
+
+    def start(self):
+        if threading.current_thread() is not threading.main_thread():
+            self.deterministic = True
+        if not self.deterministic:
+            self.previous_handler = signal.signal(signal.SIGPROF, self.sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        if not self.deterministic:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self.previous_handler)
+
+    @contextmanager
+    def attached(self, metrics):
+        """
+        profile the phases of the metrics' run while the block runs.
+        """
+        metrics.add_callback(self)
+        self.start()
+        try:
+            yield self
+        finally:
+            self.stop()
+            metrics.remove_callback(self)
+
+    def function_samples(self, phase):
+        """
+        :return: {function: [self samples, cumulative samples]} of the samples taken in the phase
+        (innermost, so the samples of a phase inside it are not counted).
+        """
+        functions = {}
+        for (phases, stack), count in self.samples.items():
+            if phases[-1] != phase:
+                continue
+            for function in set(stack):
+                functions.setdefault(function, [0, 0])[1] += count
+            functions.setdefault(stack[-1], [0, 0])[0] += count
+        return functions
+
+    def collapsed(self):
+        """
+        :return: the collapsed stacks, one "phase;...;function count" line per distinct stack.
+        """
+        return ["{} {}".format(";".join(phases + stack), count)
+                for (phases, stack), count in sorted(self.samples.items())]
+
+    def report(self, metrics=None, limit=25):
+        """
+        :return: the per-phase cumulative statistics, as text.
+        """
+        out = io.StringIO()
+        phases = list(Metrics.Metrics.PHASES) + ["learning"]
+        for phase in phases:
+            if self.deterministic:
+                if phase not in self.profiles:
+                    continue
+                out.write("== {} ==\n".format(phase))
+                pstats.Stats(self.profiles[phase], stream=out).sort_stats("cumulative").print_stats(limit)
+                continue
+            functions = self.function_samples(phase)
+            if not functions:
+                continue
+            total = sum(count for (phases_of, _), count in self.samples.items() if phases_of[-1] == phase)
+            wall = " {:.3f}s".format(metrics.phase_times[phase]) if metrics is not None and \
+                phase in metrics.phase_times else ""
+            out.write("== {}:{} {} samples of {}s ==\n".format(phase, wall, total, self.interval))
+            out.write("{:>8} {:>8}  function\n".format("self", "cumul"))
+            ranked = sorted(functions.items(), key=lambda item: (-item[1][1], -item[1][0], item[0]))
+            for function, (own, cumulative) in ranked[:limit]:
+                out.write("{:>8} {:>8}  {}\n".format(own, cumulative, function))
+            out.write("\n")
+        return out.getvalue()
+
+    def write(self, prefix, metrics=None, limit=25):
+        """
+        write the per-phase statistics to <prefix>.txt and (when sampling) the collapsed stacks to
+        <prefix>.collapsed.
+        """
+        with open(prefix + ".txt", 'w') as out:
+            out.write(self.report(metrics, limit))
+        if not self.deterministic:
+            with open(prefix + ".collapsed", 'w') as out:
+                out.write("\n".join(self.collapsed()) + "\n")
@@ -0,0 +1,104 @@
+import asyncio
+import random
+import threading
+import time
+
+import Lattice
+import LearningAlgorithm
+import Oracle
+from Tests.Run_Test import generate_random_LDFA
+
+
+def start_stub_server(automaton, latency=0.02, host="127.0.0.1"):
+    """
+    Start a local stand-in for a remote target: a TCP server (in a background thread) that answers
+    every line with the value of that word in the automaton, after an artificial latency.
+    :return: (port, stop) whereas stop() shuts the server down.
+    """
+    target = automaton.compile()
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    server_box = []
+
+    async def answer(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            await asyncio.sleep(latency)
+            writer.write("{}\n".format(target.run_word(line.decode()[:-1])).encode())
+            await writer.drain()
+        writer.close()
+
+    async def serve():
+        server_box.append(await asyncio.start_server(answer, host, 0))
+        started.set()
+
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(serve(), loop)
+    started.wait()
+    port = server_box[0].sockets[0].getsockname()[1]
+
+    def stop():
+        server_box[0].close()
+        loop.call_soon_threadsafe(loop.stop)
+
+    return port, stop
+
+
+def stub_client(port, host="127.0.0.1"):
+    """
+    :return: an async membership function that asks the stub server (one connection per query).
+    """
+    async def vq(word):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write((word + "\n").encode())
+        await writer.drain()
+        value = int((await reader.readline()).decode())
+        writer.close()
+        return value
+
+    return vq
+
+
+def compare_serial_and_async(k=10, n=10, latency=0.01, concurrency=32, table=1, seed=0):
+    """
+    Learn the same random target through the stub server, once with serial queries and once
+    with an AsyncOracle, and print the time each took. Both runs must learn the same automaton.
+    """
+    random.seed(seed)
+    alphabet = ['a', 'b']
+    lattice = Lattice.Lattice.numbers_lattice(list(range(k)))
+    automaton = generate_random_LDFA(alphabet, lattice, n)
+    port, stop = start_stub_server(automaton, latency)
+    equiv = lambda automata: True
+
+    async_vq = stub_client(port)
+    serial_oracle = Oracle.Oracle(lambda word: asyncio.run(async_vq(word)), equiv)
+    start = time.time()
+    serial = LearningAlgorithm.LearningAlgorithm(lattice, serial_oracle, alphabet, original=automaton, table=table)
+    serial_result = serial.run_algorithm()
+    serial_time = time.time() - start
+
+    async def learn():
+        async_oracle = Oracle.AsyncOracle(async_vq, equiv, concurrency=concurrency)
+        learning = await asyncio.to_thread(LearningAlgorithm.LearningAlgorithm,
+                                           lattice, async_oracle, alphabet, automaton, table)
+        result = await learning.run_algorithm_async()
+        async_oracle.close()
+        return learning, result
+
+    start = time.time()
+    concurrent, concurrent_result = asyncio.run(learn())
+    concurrent_time = time.time() - start
+    stop()
+
+    same = serial.table.T == concurrent.table.T and \
+        LearningAlgorithm.LDFA.equivalent(serial_result, concurrent_result) is None
+    print("MQ: {}, serial: {:.2f}s, async: {:.2f}s, same result: {}".format(
+        serial.metrics.unique_queries(), serial_time, concurrent_time, same))
+    return same
+
+
+if __name__ == '__main__':
+    compare_serial_and_async()
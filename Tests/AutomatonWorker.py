@@ -0,0 +1,27 @@
+"""
+A target program for Oracle.ProcessOracle: it loads an automaton from a file, then reads one word
+per line on stdin and writes the value of the word on stdout.
+usage: python Tests/AutomatonWorker.py <automaton file> <k> [<alphabet letters>]
+(the automaton is over the numbers lattice {0,...,k-1}, and the alphabet is 'ab' by default).
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import LDFA
+import Lattice
+
+
+def main():
+    file_name, k = sys.argv[1], int(sys.argv[2])
+    alphabet = list(sys.argv[3]) if len(sys.argv) > 3 else ['a', 'b']
+    lattice = Lattice.Lattice.numbers_lattice(list(range(k)))
+    target = LDFA.LDFA.create_by_input_new(alphabet, lattice, file_name).compile()
+    for line in sys.stdin:
+        sys.stdout.write("{!r}\n".format(target.run_word(line[:-1])))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
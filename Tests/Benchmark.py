@@ -0,0 +1,249 @@
+"""
+Benchmarks of the hot paths over a grid of random targets (generate_random_LDFA): for every number of
+states n, lattice size k and alphabet size, `samples` targets are generated from seeds that only depend
+on (seed, n, k, alphabet size, sample), and every operation is timed once per target.
+The median and the percentiles of the times, and the peak memory (tracemalloc) of one run on the first
+target, are printed and saved as JSON, so two runs can be compared (see compare).
+usage: python Tests/Benchmark.py [<output json>]
+       python Tests/Benchmark.py compare <before json> <after json>
+"""
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import signal
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import FOLStarObservationTable
+import LDFA
+import Lattice
+import LearningAlgorithm
+import LearnWeighted
+import Oracle
+import RPNI
+from LatticeMinimization import find_minimal_partition
+from Tests.Run_Test import generate_random_LDFA
+
+LETTERS = "abcdefghij"
+WORDS = 200  # the number of words of the run_word benchmarks
+WORD_LENGTH = 20
+RPNI_LENGTH = 3  # the sample of RPNI holds all of the words up to this length
+
+
+class Target:
+    """
+    A seeded random target of the grid, with the objects the operations are prepared from.
+    """
+
+    def __init__(self, n, k, letters, seed, sample):
+        self.n, self.k, self.letters = n, k, letters
+        self.seed = "{}:{}:{}:{}:{}".format(seed, n, k, letters, sample)
+        random.seed(self.seed)
+        self.alphabet = list(LETTERS[:letters])
+        self.lattice = Lattice.Lattice.numbers_lattice(list(range(k)))
+        self.automaton = generate_random_LDFA(self.alphabet, self.lattice, n)
+        self.compiled = self.automaton.compile()
+
+    def oracle(self):
+        target = self.compiled
+        return Oracle.Oracle(lambda word: target.run_word(word), lambda automata: True)
+
+    def words(self):
+        return [''.join(random.choice(self.alphabet) for _ in range(WORD_LENGTH)) for _ in range(WORDS)]
+
+
+# every operation prepares a call from a target (the preparation is not timed)
+
+def prepare_run_word(target):
+    words = target.words()
+    return lambda: [target.automaton.run_word(word) for word in words]
+
+
+def prepare_compiled_run_word(target):
+    words = target.words()
+    return lambda: [target.compiled.run_word(word) for word in words]
+
+
+def prepare_equivalent(target):
+    # the target against itself, so the whole product is explored
+    return lambda: LDFA.LDFA.equivalent(target.automaton, target.automaton)
+
+
+def prepare_close(target):
+    table = FOLStarObservationTable.FOLStarObservationTable(target.lattice, target.alphabet, target.oracle())
+    return table.close
+
+
+def prepare_create_automaton(target):
+    table = FOLStarObservationTable.FOLStarObservationTable(target.lattice, target.alphabet, target.oracle())
+    table.close()
+    return table.create_automaton
+
+
+def prepare_find_minimal_partition(target):
+    # a random partition of the states for every lattice value, as the FOL* table has
+    states = list(target.automaton.states)
+    partitions = []
+    for _ in range(target.k):
+        blocks = {}
+        for state in states:
+            blocks.setdefault(random.randrange(random.randint(1, len(states))), set()).add(state)
+        partitions.append(list(blocks.values()))
+    return lambda: find_minimal_partition(set(states), partitions)
+
+
+def prepare_rpni(target):
+    sample = {}
+    for length in range(RPNI_LENGTH + 1):
+        for letters in itertools.product(target.alphabet, repeat=length):
+            word = ''.join(letters)
+            sample[word] = target.compiled.run_word(word)
+    return RPNI.RPNI(target.alphabet, target.lattice, sample).run_algorithm
+
+
+def prepare_learn_weighted(target):
+    oracle = target.oracle()
+    return lambda: LearnWeighted.learn_weighted(target.alphabet, oracle)
+
+
+def prepare_learning(table):
+    def prepare(target):
+        learning = LearningAlgorithm.LearningAlgorithm(target.lattice, target.oracle(), target.alphabet,
+                                                       original=target.automaton, table=table)
+        return learning.run_algorithm
+    return prepare
+
+
+OPERATIONS = {
+    "run_word": prepare_run_word,
+    "compiled_run_word": prepare_compiled_run_word,
+    "equivalent": prepare_equivalent,
+    "close": prepare_close,
+    "create_automaton": prepare_create_automaton,
+    "find_minimal_partition": prepare_find_minimal_partition,
+    "rpni": prepare_rpni,
+    "learn_weighted": prepare_learn_weighted,
+    "learn_folstar": prepare_learning(LearningAlgorithm.LearningAlgorithm.FOLSTAR_TABLE),
+    "learn_lstar": prepare_learning(LearningAlgorithm.LearningAlgorithm.LSTAR_TABLE),
+}
+
+
+class BenchmarkTimeout(Exception):
+    pass
+
+
+def alarm(signum, frame):
+    raise BenchmarkTimeout()
+
+
+def measure(call, timeout=None):
+    """
+    run the call once, with its output suppressed (RPNI and learn_weighted print as they go).
+    :param timeout: if not None, the maximal number of seconds (an int) of the call.
+    :return: the seconds it took, or None if it ran out of time.
+    """
+    if timeout is not None:
+        signal.signal(signal.SIGALRM, alarm)
+        signal.alarm(timeout)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            call()
+            return time.perf_counter() - start
+    except BenchmarkTimeout:
+        return None
+    finally:
+        if timeout is not None:
+            signal.alarm(0)
+
+
+def peak_memory(call, timeout=None):
+    """
+    :return: the peak of the memory allocated while the call runs, in KB (None if it ran out of time).
+    """
+    tracemalloc.start()
+    try:
+        if measure(call, timeout) is None:
+            return None
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(times):
+    done = [t for t in times if t is not None]
+    if not done:
+        return {"median": None, "p10": None, "p90": None, "min": None, "max": None}
+    p10, median, p90 = np.percentile(done, [10, 50, 90])
+    return {"median": float(median), "p10": float(p10), "p90": float(p90), "min": min(done), "max": max(done)}
+
+
+def run_benchmark(states=(10, 20, 40), ks=(10, 50), alphabets=(2, 3), samples=5, operations=None,
+                  seed=0, timeout=20, output="benchmark.json"):
+    """
+    :param states, ks, alphabets: the grid of the numbers of states, the lattice sizes and the alphabet sizes.
+    :param samples: the number of targets (and so of timings) of every grid point.
+    :param operations: the names of the operations to run (see OPERATIONS), all of them by default.
+    :param timeout: the maximal number of seconds of a single call (learn_weighted does not always converge).
+    :param output: the path of the JSON results, or None.
+    :return: the results, {"environment": ..., "results": [one record per grid point and operation]}.
+    """
+    operations = list(OPERATIONS) if operations is None else operations
+    results = []
+    print("{:>4} {:>4} {:>3} {:>24} {:>10} {:>10} {:>10} {:>10} {:>8}".format(
+        "n", "k", "|A|", "operation", "median", "p10", "p90", "peak KB", "timeouts"))
+    for n, k, letters in itertools.product(states, ks, alphabets):
+        targets = [Target(n, k, letters, seed, sample) for sample in range(samples)]
+        for name in operations:
+            times = []
+            for target in targets:
+                random.seed(target.seed)  # the preparation and the call (learn_weighted) may use random
+                times.append(measure(OPERATIONS[name](target), timeout))
+            random.seed(targets[0].seed)
+            peak = peak_memory(OPERATIONS[name](targets[0]), timeout)
+            record = {"n": n, "k": k, "alphabet": letters, "operation": name, "times": times,
+                      "timeouts": times.count(None), "peak_kb": peak}
+            record.update(summarize(times))
+            results.append(record)
+            print("{:>4} {:>4} {:>3} {:>24} {:>10} {:>10} {:>10} {:>10} {:>8}".format(
+                n, k, letters, name, *["-" if record[key] is None else "{:.4f}".format(record[key])
+                                       for key in ("median", "p10", "p90")],
+                "-" if peak is None else peak, record["timeouts"]))
+    benchmark = {"environment": {"python": platform.python_version(), "machine": platform.machine(),
+                                 "numpy": np.__version__, "seed": seed, "samples": samples, "timeout": timeout},
+                 "results": results}
+    if output is not None:
+        with open(output, 'w') as out:
+            json.dump(benchmark, out, indent=1)
+    return benchmark
+
+
+def compare(before, after):
+    """
+    print the ratio of the median times (after / before) of the grid points and operations of both result files.
+    """
+    with open(before) as file:
+        old = {(r["n"], r["k"], r["alphabet"], r["operation"]): r for r in json.load(file)["results"]}
+    with open(after) as file:
+        new = {(r["n"], r["k"], r["alphabet"], r["operation"]): r for r in json.load(file)["results"]}
+    for key in sorted(old.keys() & new.keys()):
+        was, now = old[key]["median"], new[key]["median"]
+        ratio = "-" if not was or now is None else "{:.2f}x".format(now / was)
+        print("{:>4} {:>4} {:>3} {:>24} {:>10} -> {:>10} {:>8}".format(
+            *key, "-" if was is None else "{:.4f}".format(was), "-" if now is None else "{:.4f}".format(now), ratio))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == "compare":
+        compare(sys.argv[2], sys.argv[3])
+    else:
+        run_benchmark(output=sys.argv[1] if len(sys.argv) > 1 else "benchmark.json")
@@ -0,0 +1,115 @@
+"""
+Runs the trials of an experiment in a process pool, and appends the record of every finished trial
+to a JSONL file as soon as it is done, so a crashed or stopped experiment loses only its running trials.
+A restarted experiment skips the trial ids that already have a record.
+Every trial seeds the random module with its own seed (see trial_seed), so its result does not depend
+on the process it runs in, nor on the trials that ran before it.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import signal
+import time
+import traceback
+
+
+class TrialTimeout(Exception):
+    pass
+
+
+def trial_seed(seed, trial_id):
+    """
+    :return: the seed of the trial, which only depends on the experiment's seed and on the trial id.
+    """
+    return int(hashlib.sha1("{}:{}".format(seed, trial_id).encode()).hexdigest()[:16], 16)
+
+
+def completed_trials(path):
+    """
+    :return: the ids of the trials which have a record in the JSONL file (a line cut by a crash is ignored).
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as records:
+        for line in records:
+            try:
+                done.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+def alarm(signum, frame):
+    raise TrialTimeout()
+
+
+def run_trial(trial, trial_id, seed, timeout):
+    """
+    run trial(trial_id) after seeding the random module, within timeout seconds (if not None).
+    :return: the record of the trial, whose status is "ok", "timeout" or "error".
+    """
+    random.seed(trial_seed(seed, trial_id))
+    record = {"id": trial_id}
+    start = time.time()
+    if timeout is not None:
+        # the pool runs the trials in the main thread of its workers, where SIGALRM can be caught
+        signal.signal(signal.SIGALRM, alarm)
+        signal.alarm(timeout)
+    try:
+        record["result"] = trial(trial_id)
+        record["status"] = "ok"
+    except TrialTimeout:
+        record["status"] = "timeout"
+    except Exception:
+        record["status"] = "error"
+        record["error"] = traceback.format_exc()
+    finally:
+        if timeout is not None:
+            signal.alarm(0)
+    record["seconds"] = time.time() - start
+    return record
+
+
+def pool_trial(arguments):
+    return run_trial(*arguments)
+
+
+def run_experiment(trial, trial_ids, path, seed=0, processes=None, timeout=None):
+    """
+    :param trial: a function (trial id)->result, whose result can be written as JSON. It must be picklable
+    (a module level function, or a functools.partial of one) as it is sent to the pool's workers.
+    :param trial_ids: the ids of the trials of the experiment.
+    :param path: the JSONL file of the records, one {"id", "status", "result", "seconds"} per line.
+    :param seed: the seed of the experiment, which the seeds of the trials are derived from.
+    :param processes: the number of worker processes (the number of CPUs by default), 0 to run in this process.
+    :param timeout: if not None, the maximal number of seconds (an int) of a trial. A trial that runs out of
+    time is recorded as a timeout, and is not run again on a restart.
+    :return: the records of the trials run this time, in the order they finished.
+    """
+    done = completed_trials(path)
+    pending = [(trial, trial_id, seed, timeout) for trial_id in trial_ids if trial_id not in done]
+    records = []
+    with open(path, 'a') as output:
+        # a line cut by a crash is ended, so the next record starts on a line of its own
+        if output.tell() > 0:
+            with open(path, 'rb') as existing:
+                existing.seek(-1, os.SEEK_END)
+                if existing.read(1) != b"\n":
+                    output.write("\n")
+
+        def save(record):
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            records.append(record)
+
+        if processes == 0:
+            for arguments in pending:
+                save(pool_trial(arguments))
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                for record in pool.imap_unordered(pool_trial, pending):
+                    save(record)
+    return records
@@ -3,4 +3,6 @@ from Tests.Run_Test import im_feeling_lucky
 from Tests.Run_Test import lstar_vs_min
 from Tests.Run_Test import generate_and_save
 
-generate_and_save(10000)
+# the guard keeps the pool's workers from running the experiment again where they are spawned
+if __name__ == '__main__':
+    generate_and_save(10000)
@@ -3,12 +3,25 @@ import LearningAlgorithm
 import Oracle
 import random
 import Lattice
-import time
+import io
+import hashlib
+import tracemalloc
+import functools
+from Tests import ExperimentRunner
 
 
-def run_test_from_file(file_name, lattice, alphabet, table=1):
+def profile_prefix(profile, *names):
+    """
+    :param profile: the profiling option of an experiment, a path prefix or None (see LearningAlgorithm.run_algorithm).
+    :return: the path prefix of the profile of one of its learnings, or None if the experiment is not profiled.
+    """
+    return None if profile is None else "_".join([profile] + [str(name) for name in names])
+
+
+def run_test_from_file(file_name, lattice, alphabet, table=1, profile=None):
     expected_automaton = LDFA.LDFA.create_by_input(alphabet, lattice, file_name)
-    vq = lambda word: expected_automaton.run_word(word)
+    target = expected_automaton.compile()
+    vq = lambda word: target.run_word(word)
 
     expected_automaton.print_automaton()
 
@@ -16,22 +29,24 @@ def run_test_from_file(file_name, lattice, alphabet, table=1):
     oracle = Oracle.Oracle(vq, equiv)
 
     learning = LearningAlgorithm.LearningAlgorithm(lattice, oracle, alphabet, expected_automaton, table=table)
-    automaton = learning.run_algorithm()
+    automaton = learning.run_algorithm(profile=profile)
     automaton.print_automaton()
 
-    LDFA.LDFA.equivalent_by_words(alphabet, vq, automaton)
+    counter_example, checked = LDFA.LDFA.equivalent_by_words(alphabet, vq, automaton, return_checked=True)
+    print("Checked {} words, counterexample: {}".format(checked, counter_example))
 
 
-def run_test_from_lambda(fun, lattice, alphabet):
+def run_test_from_lambda(fun, lattice, alphabet, profile=None):
     vq = fun
     equiv = lambda automata: True
     oracle = Oracle.Oracle(vq, equiv)
 
     learning = LearningAlgorithm.LearningAlgorithm(lattice, oracle, alphabet)
-    automaton = learning.run_algorithm()
+    automaton = learning.run_algorithm(profile=profile)
     automaton.print_automaton()
 
-    LDFA.LDFA.equivalent_by_words(alphabet, vq, automaton)
+    counter_example, checked = LDFA.LDFA.equivalent_by_words(alphabet, vq, automaton, return_checked=True)
+    print("Checked {} words, counterexample: {}".format(checked, counter_example))
 
 
 def generate_random_LDFA(alphabet, lattice, number_of_states=10, state_values=True):
@@ -58,8 +73,9 @@ def generate_random_LDFA(alphabet, lattice, number_of_states=10, state_values=Tr
     return automaton
 
 
-def im_feeling_lucky(lattice, alphabet, count=1, save_to_file=True, state_values=True):
+def im_feeling_lucky(lattice, alphabet, count=1, save_to_file=True, state_values=True, profile=None):
     max_EQ = (0, 0)
+    successes = 0
     for i in range(count):
 
         output_file = open("results/output{}.txt".format(i), "w+") if save_to_file else None  # None
@@ -72,27 +88,30 @@ def im_feeling_lucky(lattice, alphabet, count=1, save_to_file=True, state_values
             output_file.write("Automaton Selected:\n")
         automaton.print_automaton(output_file)  # or None
 
-        vq = lambda word: automaton.run_word(word)
+        target = automaton.compile()
+        vq = lambda word: target.run_word(word)
         equiv = lambda automata: True
         oracle = Oracle.Oracle(vq, equiv)
 
         learning = LearningAlgorithm.LearningAlgorithm(lattice, oracle, alphabet, original=automaton, table=1)
 
-        result = learning.run_algorithm(output_file)
+        result = learning.run_algorithm(output_file, profile_prefix(profile, i))
 
         # print(LDFA.LDFA.equivalent(automaton, result))
 
-        print("[Test {:>5}]  States Original: {:>2} States Result: {:>2}, States Progress: {:>14} - {:>14} Success = {}"
-              .format(i, automaton.num_of_states(), result.num_of_states(), str(learning.nums_of_states), str(learning.changes),
-                      learning.cur_success))
-        if len(learning.nums_of_states) > max_EQ[0]:
-            max_EQ = len(learning.nums_of_states), i
+        metrics = learning.metrics
+        successes += metrics.success
+        print("[Test {:>5}]  States Original: {:>2} States Result: {:>2}, States Progress: {:>14} Success = {}"
+              .format(i, automaton.num_of_states(), result.num_of_states(), str(metrics.hypothesis_sizes),
+                      metrics.success))
+        if metrics.equivalence_queries > max_EQ[0]:
+            max_EQ = metrics.equivalence_queries, i
 
         output_file.close()
-    print("Score:{}/{}".format(LearningAlgorithm.LearningAlgorithm.successes, count))
+    print("Score:{}/{}".format(successes, count))
     print("Maximum EQ: {}, In test number {}".format(max_EQ[0], max_EQ[1]))
 
-def lstar_vs_min(lattice, alphabet, count=1, save_to_file=True):
+def lstar_vs_min(lattice, alphabet, count=1, save_to_file=True, profile=None):
 
     EQ_min = 0
     MQ_min = 0
@@ -100,6 +119,8 @@ def lstar_vs_min(lattice, alphabet, count=1, save_to_file=True):
     EQ_lstar = 0
     MQ_lstar = 0
 
+    successes = 0
+
     for i in range(count):
 
         output_file_lstar = open("results/output{}_lstar.txt".format(i), "w+") if save_to_file else None  # None
@@ -114,17 +135,21 @@ def lstar_vs_min(lattice, alphabet, count=1, save_to_file=True):
         automaton.print_automaton(output_file_lstar)  # or None
         automaton.print_automaton(output_file_min)  # or None
 
-        vq = lambda word: automaton.run_word(word)
+        target = automaton.compile()
+        vq = lambda word: target.run_word(word)
         equiv = lambda automata: True
-        oracle = Oracle.Oracle(vq, equiv)
+        # both learners query the same target, so they share one cache of its answers
+        cache = Oracle.QueryCache()
+        oracle_lstar = Oracle.CachingOracle(vq, equiv, cache=cache)
+        oracle_min = Oracle.CachingOracle(vq, equiv, cache=cache)
 
-        learning_lstar = LearningAlgorithm.LearningAlgorithm(lattice, oracle, alphabet,
+        learning_lstar = LearningAlgorithm.LearningAlgorithm(lattice, oracle_lstar, alphabet,
                                                              table=LearningAlgorithm.LearningAlgorithm.LSTAR_TABLE, original=automaton)
-        result_lstar = learning_lstar.run_algorithm(output_file_lstar)
+        result_lstar = learning_lstar.run_algorithm(output_file_lstar, profile_prefix(profile, i, "lstar"))
 
-        learning_min = LearningAlgorithm.LearningAlgorithm(lattice, oracle, alphabet,
+        learning_min = LearningAlgorithm.LearningAlgorithm(lattice, oracle_min, alphabet,
                                                            table=LearningAlgorithm.LearningAlgorithm.FOLSTAR_TABLE, original=automaton)
-        result_min = learning_min.run_algorithm(output_file_min)
+        result_min = learning_min.run_algorithm(output_file_min, profile_prefix(profile, i, "min"))
 
         # print(LDFA.LDFA.equivalent(result_lstar, automaton))
         # s = automaton.simplify().trim()
@@ -134,76 +159,192 @@ def lstar_vs_min(lattice, alphabet, count=1, save_to_file=True):
         # print("[Episode {:>5}] States: ({:>2}, {:>2}), EQ: ({:>4}, {:>4}), MQ: ({:>6}, {:>6}), Results = ({}, {})"
         #       .format(i,
         #               result_lstar.num_of_states(), result_min.num_of_states(),
-        #               str(len(learning_lstar.nums_of_states)), str(len(learning_min.nums_of_states)),
-        #               str(learning_lstar.table_size()), str(learning_min.table_size()),
-        #               learning_min.cur_success, learning_lstar.cur_success))
+        #               str(learning_lstar.metrics.equivalence_queries), str(learning_min.metrics.equivalence_queries),
+        #               str(learning_lstar.metrics.unique_queries()), str(learning_min.metrics.unique_queries()),
+        #               learning_min.metrics.success, learning_lstar.metrics.success))
         print("{}({}).StatesMin,StatesLstar,MQMin,MQLstar,EQMin,EQLstar:{},{},{},{},{},{}".format(
             i,
             states_num,
             result_min.num_of_states(),
             result_lstar.num_of_states(),
-            str(learning_min.table_size()),
-            str(learning_lstar.table_size()),
-            str(len(learning_min.nums_of_states)),
-            str(len(learning_lstar.nums_of_states)),
+            str(learning_min.metrics.unique_queries()),
+            str(learning_lstar.metrics.unique_queries()),
+            str(learning_min.metrics.equivalence_queries),
+            str(learning_lstar.metrics.equivalence_queries),
         ))
 
-        EQ_min += len(learning_min.nums_of_states)
-        MQ_min += learning_min.table_size()
+        EQ_min += learning_min.metrics.equivalence_queries
+        MQ_min += learning_min.metrics.unique_queries()
 
-        EQ_lstar += len(learning_lstar.nums_of_states)
-        MQ_lstar += learning_lstar.table_size()
+        EQ_lstar += learning_lstar.metrics.equivalence_queries
+        MQ_lstar += learning_lstar.metrics.unique_queries()
+        successes += learning_min.metrics.success + learning_lstar.metrics.success
 
         output_file_lstar.close()
         output_file_min.close()
-    print("Score:{}/{}".format(LearningAlgorithm.LearningAlgorithm.successes, count*2))
+    print("Score:{}/{}".format(successes, count*2))
     print("Total EQ: Lstar: {}, Min: {}".format(EQ_lstar, EQ_min))
     print("Total MQ: Lstar: {}, Min: {}".format(MQ_lstar, MQ_min))
 
-def generate_and_save(count):
+def target_id(automaton, lattice):
+    """
+    :return: an id of the automaton which only depends on its lattice and on its printed form.
+    """
+    text = io.StringIO()
+    automaton.print_automaton(text)
+    return hashlib.sha1("{}\n{}".format(lattice.lattice_set, text.getvalue()).encode()).hexdigest()
+
+
+def generate_trial(trial_id, store=None, directory="Generated", profile=None):
+    """
+    generate a random automaton and learn it with FOL*, and also with L* if its real k is at least 23,
+    in which case the automaton is saved as <directory>/a<trial_id>.txt.
+    :param store: if not None, the path of a PersistentOracle store, so a restarted run
+    does not ask again the queries of the automata it already learned.
+    :return: the summary of the trial, or None if the automaton was not kept.
+    """
     alphabet = ['a', 'b']
-    res = {}  # i: {"k": 7, "n": 8} (n is the number of states of the minimal!)
-    random.seed(0)
-    c = 10001
-    for i in range(10001, 10001 + count):
-        if i % 100 == 0:
-            time.sleep(2)
-        #     with open('Generated/tmp_summary.txt', 'w') as res_file:
-        #         res_file.write(str(res))
-
-        k = random.randint(50, 100)
-        n = random.randint(10, 70)
-        lattice = Lattice.Lattice.numbers_lattice(list(range(k)))
-        automaton = generate_random_LDFA(alphabet, lattice, n)
-
-        with open(f"Generated/a{c}.txt", 'w+') as outp:
-            automaton.print_automaton(outp)
-
-        vq = lambda word: automaton.run_word(word)
-        equiv = lambda automata: True
-        oracle = Oracle.Oracle(vq, equiv)
+    k = random.randint(50, 100)
+    n = random.randint(10, 70)
+    lattice = Lattice.Lattice.numbers_lattice(list(range(k)))
+    automaton = generate_random_LDFA(alphabet, lattice, n)
 
+    target = automaton.compile()
+    vq = lambda word: target.run_word(word)
+    equiv = lambda automata: True
+    oracle = Oracle.Oracle(vq, equiv) if store is None \
+        else Oracle.PersistentOracle(vq, equiv, store, target_id(automaton, lattice))
+    try:
         learning_min = LearningAlgorithm.LearningAlgorithm(lattice, oracle, alphabet,
                                                            table=LearningAlgorithm.LearningAlgorithm.FOLSTAR_TABLE,
                                                            original=automaton)
-        result_min = learning_min.run_algorithm()
-
-        if len(set(list(learning_min.table.T.values()))) >= 23:
+        result_min = learning_min.run_algorithm(profile=profile_prefix(profile, trial_id, "min"))
+        if learning_min.table.real_k() < 23:
+            return None
 
-            learning_lstar = LearningAlgorithm.LearningAlgorithm(lattice, oracle, alphabet,
-                                                                 table=LearningAlgorithm.LearningAlgorithm.LSTAR_TABLE,
-                                                                 original=automaton)
-            result_lstar = learning_lstar.run_algorithm()
-
-            res[c] = {"k": k, "n": len(result_min.states), "n_lstar": len(result_lstar.states),
-                      "MQ_min": learning_min.table_size(), "MQ_lstar": learning_lstar.table_size(),
-                      "EQ_min": learning_min.EQs, "EQ_lstar": learning_lstar.EQs, "real_k": len(set(list(learning_min.table.T.values())))}
-
-            print(f'{c}: {res[c]},')
-
-            c += 1
+        learning_lstar = LearningAlgorithm.LearningAlgorithm(lattice, oracle, alphabet,
+                                                             table=LearningAlgorithm.LearningAlgorithm.LSTAR_TABLE,
+                                                             original=automaton)
+        result_lstar = learning_lstar.run_algorithm(profile=profile_prefix(profile, trial_id, "lstar"))
+    finally:
+        if store is not None:
+            oracle.close()
+
+    with open(f"{directory}/a{trial_id}.txt", 'w+') as outp:
+        automaton.print_automaton(outp)
+    return {"k": k, "n": len(result_min.states), "n_lstar": len(result_lstar.states),
+            "MQ_min": learning_min.metrics.unique_queries(), "MQ_lstar": learning_lstar.metrics.unique_queries(),
+            "MQ_total_min": learning_min.metrics.membership_queries(),
+            "MQ_total_lstar": learning_lstar.metrics.membership_queries(),
+            "EQ_min": learning_min.metrics.equivalence_queries, "EQ_lstar": learning_lstar.metrics.equivalence_queries,
+            "real_k": learning_min.table.real_k()}
+
+
+def generate_and_save(count, store=None, directory="Generated", processes=None, timeout=None, seed=0,
+                      profile=None):
+    """
+    run count generate_trial trials (ids 10001...) in a process pool, see ExperimentRunner.run_experiment.
+    The summary of every trial is appended to <directory>/summary_extra.jsonl once it is done,
+    and a restarted run skips the trials which are already there.
+    :param store: if not None, the path of a PersistentOracle store (shared by the workers).
+    :param timeout: if not None, the maximal number of seconds of a trial.
+    :param profile: if not None, a path prefix of the profiles of the learnings (see profile_prefix).
+    """
+    trial = functools.partial(generate_trial, store=store, directory=directory, profile=profile)
+    records = ExperimentRunner.run_experiment(trial, range(10001, 10001 + count),
+                                              f"{directory}/summary_extra.jsonl", seed=seed,
+                                              processes=processes, timeout=timeout)
+    for record in sorted(records, key=lambda record: record["id"]):
+        if record["status"] != "ok":
+            print(f'{record["id"]}: {record["status"]}')
+        elif record["result"] is not None:
+            print(f'{record["id"]}: {record["result"]},')
         else:
             print("#")
 
-    with open('Generated/summary_extra.txt', 'w') as res_file:
-        res_file.write(str(res))
\ No newline at end of file
+
+def example_automata():
+    """
+    :return: a list of (name, lattice) of the automata of the Examples directory which are over ['a', 'b'].
+    """
+    numbers = Lattice.Lattice.numbers_lattice(list(range(11)))
+    sets = Lattice.Lattice.sets_lattice(Lattice.Lattice.power_set({1, 2, 3}))
+    return [(name, numbers) for name in ["automaton7", "automaton12", "automaton13", "automaton14",
+                                         "automaton19", "full_ordered1", "full_ordered2", "temp_test",
+                                         "temp_test1", "temp_test2"]] + \
+           [(name, sets) for name in ["automaton10", "automaton17", "automaton18"]]
+
+
+def compare_counter_modes(examples=None, directory="Examples", profile=None):
+    """
+    Learn automata of the Examples directory with both counterexample modes (all suffixes and a single
+    Rivest-Schapire suffix) and both tables, and print the MQ (distinct words asked) and EQ counts of each.
+    :param examples: a list of (name, lattice) of the automata to learn, all of them over ['a', 'b'].
+    """
+    alphabet = ['a', 'b']
+    if examples is None:
+        examples = example_automata()
+    modes = [LearningAlgorithm.LearningAlgorithm.ALL_SUFFIXES, LearningAlgorithm.LearningAlgorithm.RS_SUFFIX]
+    tables = [LearningAlgorithm.LearningAlgorithm.FOLSTAR_TABLE, LearningAlgorithm.LearningAlgorithm.LSTAR_TABLE]
+    totals = {(table, mode): [0, 0] for table in tables for mode in modes}
+    for name, lattice in examples:
+        automaton = LDFA.LDFA.create_by_input_new(alphabet, lattice, "{}/{}.txt".format(directory, name))
+        target = automaton.compile()
+        vq = lambda word: target.run_word(word)
+        equiv = lambda automata: True
+        counts = []
+        for table in tables:
+            for mode in modes:
+                oracle = Oracle.CachingOracle(vq, equiv)
+                learning = LearningAlgorithm.LearningAlgorithm(lattice, oracle, alphabet, original=automaton,
+                                                               table=table, counter_mode=mode)
+                learning.run_algorithm(profile=profile_prefix(profile, name, table, mode))
+                counts.append("{}/{}".format(oracle.unique_queries(), learning.metrics.equivalence_queries))
+                totals[table, mode][0] += oracle.unique_queries()
+                totals[table, mode][1] += learning.metrics.equivalence_queries
+        print("{:>14}: MQ/EQ FOL* (all, RS): {:>8} {:>8}, L* (all, RS): {:>8} {:>8}".format(name, *counts))
+    for table in tables:
+        print("Total MQ/EQ {}: all suffixes: {}/{}, RS: {}/{}".format(
+            "FOL*" if table == LearningAlgorithm.LearningAlgorithm.FOLSTAR_TABLE else "L*",
+            *totals[table, modes[0]], *totals[table, modes[1]]))
+
+
+def dtree_vs_folstar(count=20, directory="Tests/FullOrderTests/Generated", k=100, max_iterations=None,
+                     profile=None):
+    """
+    Learn automata of the Generated directory with the FOL* table and with the discrimination tree,
+    and print the MQ and EQ counts, the number of states, the peak memory of each learning and
+    whether the result is equivalent to the target.
+    :param k: the automata are read over the numbers lattice {0,...,k-1}.
+    :param max_iterations: if not None, the maximal number of EQs of both learners.
+    """
+    alphabet = ['a', 'b']
+    lattice = Lattice.Lattice.numbers_lattice(list(range(k)))
+    learners = [("FOL*", LearningAlgorithm.LearningAlgorithm.FOLSTAR_TABLE),
+                ("DTREE", LearningAlgorithm.LearningAlgorithm.DTREE)]
+    totals = {name: [0, 0, 0] for name, _ in learners}  # MQ, peak memory, successes
+    for i in range(count):
+        automaton = LDFA.LDFA.create_by_input_new(alphabet, lattice, "{}/a{}.txt".format(directory, i))
+        target = automaton.compile()
+        vq = lambda word: target.run_word(word)
+        equiv = lambda automata: True
+        line = []
+        for name, table in learners:
+            tracemalloc.start()
+            learning = LearningAlgorithm.LearningAlgorithm(lattice, Oracle.Oracle(vq, equiv), alphabet,
+                                                           original=automaton, table=table)
+            if max_iterations is not None:
+                learning.MAX_ITERATIONS = max_iterations
+            result = learning.run_algorithm(profile=profile_prefix(profile, i, name.strip("*")))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            success = LDFA.LDFA.equivalent(automaton, result) is None
+            line.append("{}: MQ {:>6}, EQ {:>3}, states {:>4}, {:>6}KB, {}".format(
+                name, learning.metrics.unique_queries(), learning.metrics.equivalence_queries, result.num_of_states(), peak // 1024, success))
+            totals[name][0] += learning.metrics.unique_queries()
+            totals[name][1] += peak
+            totals[name][2] += success
+        print("a{}: {}".format(i, " | ".join(line)))
+    for name, _ in learners:
+        print("Total {}: MQ {}, peak memory {}KB, equivalent {}/{}".format(
+            name, totals[name][0], totals[name][1] // 1024, totals[name][2], count))
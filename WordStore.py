@@ -0,0 +1,171 @@
+from collections.abc import MutableMapping
+
+
+class WordStore(MutableMapping):
+    """
+    The values of the queried words, kept without the words themselves.
+    The rows (prefixes) are interned in a trie and the columns (suffixes) in a reversed trie,
+    so every prefix and suffix is an integer id, and extending a row by a letter (or a column
+    by a letter in front) is one step in a trie, with no string built.
+    A cell is addressed by (prefix id, suffix id). Since the same word can be split into a prefix
+    and a suffix in several ways, its value is kept in one canonical cell only: the one whose prefix
+    is the longest prefix of the word in the trie (see canonical), so a word is never queried twice.
+    The store is also a mapping {word: value}, as the dictionary T of the tables used to be.
+    """
+
+    ROOT = 0  # the id of the empty word, both as a prefix and as a suffix
+
+    def __init__(self):
+        self.prefix_next = [{}]  # prefix_next[p][letter] is the id of the prefix p + letter
+        self.prefix_parent = [-1]
+        self.prefix_letter = ['']
+        self.suffix_next = [{}]  # suffix_next[c][letter] is the id of the suffix letter + c
+        self.suffix_parent = [-1]
+        self.suffix_letter = ['']
+        self.cells = [{}]  # cells[p][c] is the value of the word p + c, for canonical cells only
+        self.count = 0
+
+    def extend_prefix(self, p, letter):
+        """
+        :return: the id of the prefix p + letter, which is added to the trie if needed.
+        The values of the words which start with the new prefix move to their new canonical cells.
+        """
+        q = self.prefix_next[p].get(letter)
+        if q is not None:
+            return q
+        q = len(self.prefix_parent)
+        self.prefix_next[p][letter] = q
+        self.prefix_next.append({})
+        self.prefix_parent.append(p)
+        self.prefix_letter.append(letter)
+        self.cells.append({})
+        moved = [c for c in self.cells[p] if self.suffix_letter[c] == letter]
+        for c in moved:
+            self.cells[q][self.suffix_parent[c]] = self.cells[p].pop(c)
+        return q
+
+    def extend_suffix(self, c, letter):
+        """
+        :return: the id of the suffix letter + c, which is added to the reversed trie if needed.
+        """
+        d = self.suffix_next[c].get(letter)
+        if d is not None:
+            return d
+        d = len(self.suffix_parent)
+        self.suffix_next[c][letter] = d
+        self.suffix_next.append({})
+        self.suffix_parent.append(c)
+        self.suffix_letter.append(letter)
+        return d
+
+    def prefix(self, word):
+        p = WordStore.ROOT
+        for letter in word:
+            p = self.extend_prefix(p, letter)
+        return p
+
+    def suffix(self, word):
+        c = WordStore.ROOT
+        for letter in reversed(word):
+            c = self.extend_suffix(c, letter)
+        return c
+
+    def prefix_word(self, p):
+        letters = []
+        while p != WordStore.ROOT:
+            letters.append(self.prefix_letter[p])
+            p = self.prefix_parent[p]
+        return ''.join(reversed(letters))
+
+    def suffix_word(self, c):
+        letters = []
+        while c != WordStore.ROOT:
+            letters.append(self.suffix_letter[c])
+            c = self.suffix_parent[c]
+        return ''.join(letters)
+
+    def word(self, p, c):
+        return self.prefix_word(p) + self.suffix_word(c)
+
+    def canonical(self, p, c):
+        """
+        :return: the canonical cell of the word p + c: its first letters are moved from the suffix
+        to the prefix, for as long as the longer prefix is in the trie.
+        """
+        prefix_next, suffix_letter, suffix_parent = self.prefix_next, self.suffix_letter, self.suffix_parent
+        while c != WordStore.ROOT:
+            q = prefix_next[p].get(suffix_letter[c])
+            if q is None:
+                break
+            p, c = q, suffix_parent[c]
+        return p, c
+
+    def get_cell(self, p, c, default=None):
+        # the loop of canonical, inlined as this is the hot path of the tables
+        prefix_next, suffix_letter, suffix_parent = self.prefix_next, self.suffix_letter, self.suffix_parent
+        while c != WordStore.ROOT:
+            q = prefix_next[p].get(suffix_letter[c])
+            if q is None:
+                break
+            p, c = q, suffix_parent[c]
+        return self.cells[p].get(c, default)
+
+    def set_cell(self, p, c, value):
+        p, c = self.canonical(p, c)
+        if c not in self.cells[p]:
+            self.count += 1
+        self.cells[p][c] = value
+
+    def has_cell(self, p, c):
+        p, c = self.canonical(p, c)
+        return c in self.cells[p]
+
+    def locate(self, word, add=False):
+        """
+        :return: the canonical cell of the word, or None if add is False and there can be no value for it.
+        """
+        p, i = WordStore.ROOT, 0
+        while i < len(word):
+            q = self.prefix_next[p].get(word[i])
+            if q is None:
+                break
+            p, i = q, i + 1
+        c = WordStore.ROOT
+        for letter in reversed(word[i:]):
+            d = self.suffix_next[c].get(letter)
+            if d is None:
+                if not add:
+                    return None
+                d = self.extend_suffix(c, letter)
+            c = d
+        return p, c
+
+    def __getitem__(self, word):
+        cell = self.locate(word)
+        if cell is None or cell[1] not in self.cells[cell[0]]:
+            raise KeyError(word)
+        return self.cells[cell[0]][cell[1]]
+
+    def __contains__(self, word):
+        cell = self.locate(word)
+        return cell is not None and cell[1] in self.cells[cell[0]]
+
+    def __setitem__(self, word, value):
+        self.set_cell(*self.locate(word, add=True), value)
+
+    def __delitem__(self, word):
+        cell = self.locate(word)
+        if cell is None or cell[1] not in self.cells[cell[0]]:
+            raise KeyError(word)
+        del self.cells[cell[0]][cell[1]]
+        self.count -= 1
+
+    def __iter__(self):
+        for p, cells in enumerate(self.cells):
+            if cells:
+                prefix = self.prefix_word(p)
+                for c in list(cells):
+                    yield prefix + self.suffix_word(c)
+
+    def __len__(self):
+        return self.count